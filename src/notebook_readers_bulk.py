@@ -1,12 +1,7 @@
 # %%
 from thesis_readers import *
 from thesis_readers.misc import constants
-from thesis_readers.misc.helper import test_reader
-import itertools as it
-import pandas as pd
-import jsonlines
-
-stats_collector = []
+from thesis_readers.misc.bulk import main
 
 # reader = AbstractProcessLogReader(
 #     log_path=constants.DATA_FOLDER / 'dataset_bpic2020_tu_travel/RequestForPayment.xes',
@@ -21,39 +16,7 @@ stats_collector = []
 #     test_dataset(reader, DatasetModes.TRAIN, *combo)
 
 # print(reader.get_data_statistics())
-# %% -------------------------------------------------------------------------------
-reader = BPIC12LogReader()
-stats_collector.append(test_reader(reader, True, save_viz=True))
-reader.data.head()
-# %% -------------------------------------------------------------------------------
-reader = DomesticDeclarationsLogReader()
-stats_collector.append(test_reader(reader, True, save_viz=True))
-reader.data.head()
-# %% -------------------------------------------------------------------------------
-reader = PermitLogReader()
-stats_collector.append(test_reader(reader, True, save_viz=True))
-reader.data.head()
-# %% -------------------------------------------------------------------------------
-reader = RabobankTicketsLogReader()
-stats_collector.append(test_reader(reader, True, save_viz=True))
-reader.data.head()
-# %% -------------------------------------------------------------------------------
-reader = RequestForPaymentLogReader()
-stats_collector.append(test_reader(reader, True, save_viz=True))
-reader.data.head()
-# %% -------------------------------------------------------------------------------
-reader = VolvoIncidentsReader()
-stats_collector.append(test_reader(reader, True, save_viz=True))
-reader.data.head()
-# %% -------------------------------------------------------------------------------
-reader = HospitalLogReader()
-stats_collector.append(test_reader(reader, True, with_viz_procmap=False, save_viz=True))
-reader.data.head()
-# # %% -------------------------------------------------------------------------------
-# reader = SepsisLogReader()
-# stats_collector.append(test_reader(reader, True))
-# reader.data.head()
-
-# %% ------------------------------
-jsonlines.open('statst.jsonl', mode='w').write_all(stats_collector)
-pd.json_normalize([dict(jl, column_stats=None) for jl in stats_collector]).to_csv('statst.csv')
\ No newline at end of file
+# %% ------------------------------ Every reader runs in its own process, see thesis_readers.misc.bulk
+# The spawned workers import this file again, so nothing may run outside of the guard
+if __name__ == '__main__':
+    stats_collector = main(num_workers=4, memory_limit_mb=16000, save_path_jsonl='statst.jsonl', save_path_csv='statst.csv')
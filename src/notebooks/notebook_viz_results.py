@@ -1,4 +1,5 @@
 # %%
+import pathlib
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -7,14 +8,18 @@ import seaborn as sns
 import matplotlib.cm as cm
 import matplotlib.colors as colors
 
-from helper.constants import NUMBER_OF_INSTANCES, SEQUENCE_LENGTH
+from thesis_predictors.helper.constants import NUMBER_OF_INSTANCES, SEQUENCE_LENGTH
+from thesis_predictors.helper.result_store import import_csv_results, list_result_store, load_aggregates
 # %%
 METRIC = "damerau_levenshtein"
+RESULTS_FOLDER = pathlib.Path("results")
+# Reader the CSV results of earlier runs were evaluated on, their file names only hold the prefix and the model
+LEGACY_RESULTS_DATASET = "DomesticDeclarationsLogReader"
 
 
 # %%
-def extract_plot_data(METRIC, results):
-    t_res = results.groupby("input_x_seq_len").agg(["mean", "std", "median"])[METRIC]
+def extract_plot_data(METRIC, aggregates):
+    t_res = aggregates[aggregates["metric"] == METRIC].set_index("input_x_seq_len")[["mean", "std", "median"]]
     t_res = t_res.fillna(0.001)
     t_res["min"] = t_res["mean"] - (2 * t_res["std"])
     t_res["max"] = t_res["mean"] + (2 * t_res["std"])
@@ -29,17 +34,21 @@ def plot_curve(ax, res, title, color=None):
 
 
 # %%
-full_lstm_one_way = pd.read_csv('results/result_full_lstm_model_one_way.csv').set_index("trace")
-simple_lstm_one_way = pd.read_csv('results/result_simple_lstm_model_one_way.csv').set_index("trace")
-transformer_one_way = pd.read_csv('results/result_transformer_model_one_way.csv').set_index("trace")
-transformer_two_way = pd.read_csv('results/result_transformer_model_two_way.csv').set_index("trace")
+# CSV results of runs before the result store are imported once
+if not len(list_result_store(RESULTS_FOLDER)):
+    for csv_path in RESULTS_FOLDER.glob("*.csv"):
+        import_csv_results(csv_path, LEGACY_RESULTS_DATASET, RESULTS_FOLDER)
+display(list_result_store(RESULTS_FOLDER))
 
-data = {
-    "Full Vector LSTM (One Way)": extract_plot_data(METRIC, simple_lstm_one_way),
-    "Simple LSTM (One Way)": extract_plot_data(METRIC, full_lstm_one_way),
-    "Transformer (One Way)": extract_plot_data(METRIC, transformer_one_way),
-    "Transformer (Two Way)": extract_plot_data(METRIC, transformer_two_way)
+# %%
+aggregates = load_aggregates(RESULTS_FOLDER, metrics=METRIC)
+model_names = {
+    "full_lstm_model_one_way": "Full Vector LSTM (One Way)",
+    "simple_lstm_model_one_way": "Simple LSTM (One Way)",
+    "transformer_model_one_way": "Transformer (One Way)",
+    "transformer_model_two_way": "Transformer (Two Way)",
 }
+data = {model_names.get(model, model): extract_plot_data(METRIC, model_aggregates) for model, model_aggregates in aggregates.groupby("model")}
 
 
 def plot_all(data):
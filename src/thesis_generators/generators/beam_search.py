@@ -0,0 +1,179 @@
+import time
+from typing import Callable, Tuple
+
+import numpy as np
+from tensorflow.keras import Model
+from tensorflow.keras.layers import LSTM
+from thesis_readers import AbstractProcessLogReader
+from thesis_readers import DomesticDeclarationsLogReader as Reader
+
+from thesis_generators.generators.heuristic import HeuristicGenerator
+from thesis_generators.predictors.wrapper import ModelWrapper
+
+
+class FullSequenceScorer():
+    """Scores every edit by running the whole model on the edited sequence."""
+    def __init__(self, score_candidates: Callable[[np.ndarray], np.ndarray], max_candidates: int = 8192):
+        self.score_candidates = score_candidates
+        self.max_candidates = max_candidates
+
+    def score_edits(self, beams: np.ndarray, edit_beams: np.ndarray, edit_positions: np.ndarray, edit_states: np.ndarray) -> np.ndarray:
+        candidates = beams[edit_beams]
+        candidates[np.arange(len(candidates)), edit_positions] = edit_states
+        return np.concatenate([self.score_candidates(candidates[start:start + self.max_candidates]) for start in range(0, len(candidates), self.max_candidates)])
+
+
+class RecurrentSequenceScorer():
+    """Scores edits of one way LSTM models from the cached state in front of the edited position.
+
+    The outputs before a position do not depend on it, so every edit only runs its suffix. The recurrence is computed with numpy from the model's weights,
+    which also works for models that were revived from a SavedModel.
+    """
+    def __init__(self, model: Model):
+        embeddings = model.embedding.get_weights()[0]
+        kernel, self.recurrent_kernel, bias = model.lstm_layer.get_weights()
+        self.dense_kernel, self.dense_bias = model.time_distributed_layer.get_weights()
+        # FullLSTMModelOneWay concatenates features to the embeddings, which ModelWrapper.prepare_input feeds as zeros. So the input projection is a lookup table.
+        self.input_projection = embeddings @ kernel[:embeddings.shape[1]] + bias
+        self.units = self.recurrent_kernel.shape[0]
+
+    @staticmethod
+    def supports(model: Model) -> bool:
+        lstm_layer = getattr(model, "lstm_layer", None)
+        if not isinstance(lstm_layer, LSTM) or not hasattr(model, "embedding") or not hasattr(model, "time_distributed_layer"):
+            return False
+        config = lstm_layer.get_config()
+        return config["activation"] == "tanh" and config["recurrent_activation"] == "sigmoid" and not config.get("go_backwards")
+
+    def _step(self, tokens: np.ndarray, state_h: np.ndarray, state_c: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Gates in the order of keras' LSTM kernel: input, forget, cell, output
+        z = self.input_projection[tokens] + state_h @ self.recurrent_kernel
+        gate_i, gate_f, gate_c, gate_o = np.split(z, 4, axis=-1)
+        state_c = _sigmoid(gate_f) * state_c + _sigmoid(gate_i) * np.tanh(gate_c)
+        return _sigmoid(gate_o) * np.tanh(state_c), state_c
+
+    def _log_probs(self, state_h: np.ndarray, tokens: np.ndarray) -> np.ndarray:
+        logits = state_h @ self.dense_kernel + self.dense_bias
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        return logits[np.arange(len(tokens)), tokens] - np.log(np.exp(logits).sum(axis=-1))
+
+    def score_edits(self, beams: np.ndarray, edit_beams: np.ndarray, edit_positions: np.ndarray, edit_states: np.ndarray) -> np.ndarray:
+        num_beams, seq_len = beams.shape
+        # State in front of every position and log probability at every position of the unedited beams
+        all_h, all_c = np.zeros((2, seq_len + 1, num_beams, self.units), dtype=self.recurrent_kernel.dtype)
+        beam_log_probs = np.zeros((num_beams, seq_len))
+        for step in range(seq_len):
+            all_h[step + 1], all_c[step + 1] = self._step(beams[:, step], all_h[step], all_c[step])
+            beam_log_probs[:, step] = self._log_probs(all_h[step + 1], beams[:, step])
+        prefix_scores = np.cumsum(beam_log_probs, axis=-1) - beam_log_probs
+
+        # Sorted by position, the edits that already started at a step form a prefix of the sorted arrays
+        order = np.argsort(edit_positions, kind="stable")
+        sorted_beams, sorted_positions, sorted_states = edit_beams[order], edit_positions[order], edit_states[order]
+        state_h, state_c = np.zeros((2, len(order), self.units), dtype=self.recurrent_kernel.dtype)
+        suffix_scores = np.zeros(len(order))
+        for step in range(sorted_positions.min(initial=seq_len), seq_len):
+            first_start, num_active = np.searchsorted(sorted_positions, step, side="left"), np.searchsorted(sorted_positions, step, side="right")
+            starting = slice(first_start, num_active)
+            state_h[starting], state_c[starting] = all_h[step, sorted_beams[starting]], all_c[step, sorted_beams[starting]]
+            tokens = beams[sorted_beams[:num_active], step]
+            tokens[starting] = sorted_states[starting]
+            state_h[:num_active], state_c[:num_active] = self._step(tokens, state_h[:num_active], state_c[:num_active])
+            suffix_scores[:num_active] += self._log_probs(state_h[:num_active], tokens)
+
+        scores = np.empty(len(order))
+        scores[order] = prefix_scores[sorted_beams, sorted_positions] + suffix_scores
+        return scores
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+
+class BeamSearchGenerator(HeuristicGenerator):
+    def __init__(self, reader: AbstractProcessLogReader, model_wrapper: ModelWrapper, threshold: float = 0.8, beam_width: int = 5, use_state_cache: bool = True):
+        super(BeamSearchGenerator, self).__init__(reader, model_wrapper, threshold)
+        self.beam_width = beam_width
+        model = model_wrapper.prediction_model
+        if use_state_cache and RecurrentSequenceScorer.supports(model):
+            self.scorer = RecurrentSequenceScorer(model)
+        else:
+            # Attention and bidirectional layers look at the whole sequence, there is no prefix state to reuse
+            self.scorer = FullSequenceScorer(self.score_candidates)
+
+    def generate_counterfactuals(self, true_seqs: np.ndarray, desired_outcome: int, num_edits: int = 5) -> np.ndarray:
+        beams, beam_rows, _ = self.search(true_seqs, desired_outcome, num_edits)
+        # Beams are sorted by row and score, so the first beam of a row is its best one
+        _, best_beams = np.unique(beam_rows, return_index=True)
+        return beams[best_beams]
+
+    def search(self, true_seqs: np.ndarray, desired_outcome: int, num_edits: int = 5) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Keeps the beam_width most likely sequences per row over num_edits rounds of single position edits.
+
+        Returns the beams, the row each beam belongs to and its log probability. With beam_width=1 this is the greedy search of HeuristicGenerator.generate_counterfactuals.
+        """
+        true_seqs = np.array(np.atleast_2d(true_seqs), dtype=int)
+        counterfactuals = true_seqs.copy()
+        num_rows = len(counterfactuals)
+        cutoff_points = np.argmax(counterfactuals == self.end_id, axis=-1) - 1
+        counterfactuals[np.arange(num_rows), cutoff_points] = desired_outcome
+        states = np.arange(2, self.num_states - 2)
+        beams, beam_rows, beam_scores = counterfactuals, np.arange(num_rows), np.full(num_rows, -np.inf)
+
+        for edit_num in range(num_edits):
+            positions = np.arange(self.longest_sequence)
+            edit_beams, edit_positions = np.nonzero((positions[None] >= 1) & (positions[None] < cutoff_points[beam_rows][:, None]))
+            if not len(edit_beams):
+                break
+            edit_beams, edit_positions, edit_states = np.repeat(edit_beams, len(states)), np.repeat(edit_positions, len(states)), np.tile(states, len(edit_beams))
+            is_viable = self.filter_edits(true_seqs, beams, beam_rows, edit_beams, edit_positions, edit_states)
+            edit_beams, edit_positions, edit_states = edit_beams[is_viable], edit_positions[is_viable], edit_states[is_viable]
+            if not len(edit_beams):
+                break
+            scores = self.scorer.score_edits(beams, edit_beams, edit_positions, edit_states)
+            candidates = beams[edit_beams]
+            candidates[np.arange(len(candidates)), edit_positions] = edit_states
+            # Rows without any viable edit keep their beams
+            is_kept = ~np.isin(beam_rows, beam_rows[edit_beams])
+            beams, beam_rows, beam_scores = self._select_top_beams(
+                np.concatenate([beams[is_kept], candidates]),
+                np.concatenate([beam_rows[is_kept], beam_rows[edit_beams]]),
+                np.concatenate([beam_scores[is_kept], scores]),
+            )
+        return beams, beam_rows, beam_scores
+
+    def _select_top_beams(self, candidates: np.ndarray, candidate_rows: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Different edit orders can lead to the same sequence, which should occupy only one beam
+        _, is_unique = np.unique(np.column_stack([candidate_rows, candidates]), axis=0, return_index=True)
+        candidates, candidate_rows, scores = candidates[is_unique], candidate_rows[is_unique], scores[is_unique]
+        order = np.lexsort((-scores, candidate_rows))
+        sorted_rows = candidate_rows[order]
+        rank_in_row = np.arange(len(order)) - np.searchsorted(sorted_rows, sorted_rows, side='left')
+        selected = order[rank_in_row < self.beam_width]
+        return candidates[selected], candidate_rows[selected], scores[selected]
+
+
+def benchmark_state_caching(reader: AbstractProcessLogReader, model_wrapper: ModelWrapper, true_seqs: np.ndarray, desired_outcome: int, beam_width: int = 5):
+    results = {"num_sequences": len(true_seqs), "beam_width": beam_width}
+    for use_state_cache in [False, True]:
+        generator = BeamSearchGenerator(reader, model_wrapper, beam_width=beam_width, use_state_cache=use_state_cache)
+        start_time = time.perf_counter()
+        counterfactuals = generator.generate_counterfactuals(true_seqs, desired_outcome)
+        duration = time.perf_counter() - start_time
+        label = type(generator.scorer).__name__
+        results[f"{label}_cf_per_sec"] = len(true_seqs) / duration
+        results[f"{label}_counterfactuals"] = counterfactuals
+    return results
+
+
+if __name__ == "__main__":
+    reader = Reader().init_data()
+    sample = reader.get_split_arrays()[0][0].astype(int)
+    examples = sample[np.any(sample == reader.end_id, axis=-1)][:15]
+    predictor = ModelWrapper(reader).load_model_by_num(1)
+    generator = BeamSearchGenerator(reader, predictor, beam_width=5)
+    print(f"Scoring with {type(generator.scorer).__name__}")
+    beams, beam_rows, beam_scores = generator.search(examples[4], 6)
+    print(beams)
+    print(beam_scores)
+    print({key: val for key, val in benchmark_state_caching(reader, predictor, examples, 6).items() if not key.endswith("_counterfactuals")})
@@ -1,3 +1,4 @@
+import time
 from typing import Union
 from thesis_readers import AbstractProcessLogReader
 from tensorflow.keras import Model
@@ -8,6 +9,7 @@ from thesis_readers import DomesticDeclarationsLogReader as Reader
 
 from thesis_generators.helper.constants import SYMBOL_MAPPING
 from thesis_generators.predictors.wrapper import ModelWrapper
+from thesis_predictors.evaluation.sequence_metrics import damerau_levenshtein
 
 
 class HeuristicGenerator():
@@ -20,14 +22,15 @@ class HeuristicGenerator():
         self.end_id = self.reader.end_id
 
     def generate_counterfactual(self, true_seq: np.ndarray, desired_outcome: int) -> np.ndarray:
-        cutoff_points = tf.argmax((true_seq == self.end_id), -1) - 1
+        cutoff_points = tf.argmax((true_seq == self.end_id), -1).numpy() - 1
         counter_factual_candidate = np.array(true_seq, dtype=int)
-        counter_factual_candidate[:, cutoff_points] = desired_outcome
+        counter_factual_candidate[np.arange(len(counter_factual_candidate)), cutoff_points] = desired_outcome
         num_edits = 5
+        all_counterfactuals = []
         for row_num, row in enumerate(counter_factual_candidate):
             for edit_num in range(num_edits):
                 cut_off = cutoff_points[row_num]
-                true_seq_cut = row[:]
+                true_seq_cut = np.array(true_seq[row_num], dtype=int)
                 top_options = np.zeros((cut_off, self.longest_sequence))
                 top_probabilities = (-np.ones(cut_off) * np.inf)
                 for step in reversed(range(1, cut_off)):  # stack option sets
@@ -49,22 +52,82 @@ class HeuristicGenerator():
                     seq_probs_rank = np.argsort(seq_probs)[::-1]
                     options_ranked = options[seq_probs_rank, :]
                     seq_probs_ranked = seq_probs[seq_probs_rank]
-                    all_metrics = [self.compute_sequence_metrics(true_seq_cut, cf_seq_cut) for cf_seq_cut in options_ranked]
-                    # selected_metrics = [idx for idx, metrics in enumerate(all_metrics) if metrics['damerau_levenshtein'] >= self.threshold]
-                    # viable_candidates = options_ranked[selected_metrics]
-                    viable_candidates = options_ranked
+                    # Only the similarity of the threshold is computed, so benchmark_counterfactual_search compares the search strategies alone
+                    lengths = np.full(len(options_ranked), len(true_seq_cut))
+                    similarities = damerau_levenshtein(np.repeat(true_seq_cut[None], len(options_ranked), axis=0), lengths, options_ranked, lengths)
+                    selected_metrics = np.flatnonzero(similarities >= self.threshold)
+                    viable_candidates = options_ranked[selected_metrics]
+                    if not len(viable_candidates):
+                        continue
                     # print("Top")
                     # print(viable_candidates[:5])
                     top_options[cut_off - step - 1] = viable_candidates[0]
-                    top_probabilities[cut_off - step - 1] = seq_probs_ranked[0]
+                    top_probabilities[cut_off - step - 1] = seq_probs_ranked[selected_metrics][0]
                     # print("Round done")
-                print(f"TOP RESULTS")
-                print(top_options)
-                print(top_probabilities)
-                print(top_probabilities.argmax())
-                print(top_options[top_probabilities.argmax()])
+                if np.isneginf(top_probabilities.max(initial=-np.inf)):
+                    break
                 row = top_options[top_probabilities.argmax()].astype(int)
-        print("Done")
+            all_counterfactuals.append(row)
+        return np.array(all_counterfactuals)
+
+    def generate_counterfactuals(self, true_seqs: np.ndarray, desired_outcome: int, num_edits: int = 5, max_candidates: int = 8192) -> np.ndarray:
+        """Batched version of generate_counterfactual.
+
+        Every edit round builds all single position edits of all rows at once, predicts them in chunks of max_candidates and keeps the most likely edit per row.
+        """
+        true_seqs = np.array(np.atleast_2d(true_seqs), dtype=int)
+        counterfactuals = true_seqs.copy()
+        num_rows = len(counterfactuals)
+        cutoff_points = np.argmax(counterfactuals == self.end_id, axis=-1) - 1
+        counterfactuals[np.arange(num_rows), cutoff_points] = desired_outcome
+        states = np.arange(2, self.num_states - 2)
+        # Same edit positions as generate_counterfactual, everything between the first position and the cutoff
+        row_idx, pos_idx = np.nonzero(np.arange(self.longest_sequence)[None] < cutoff_points[:, None])
+        is_editable = pos_idx >= 1
+        row_idx, pos_idx = row_idx[is_editable], pos_idx[is_editable]
+        candidate_rows = np.repeat(row_idx, len(states))
+        candidate_positions = np.repeat(pos_idx, len(states))
+        candidate_states = np.tile(states, len(row_idx))
+        if not len(candidate_rows):
+            return counterfactuals
+
+        for edit_num in range(num_edits):
+            is_viable = self.filter_edits(true_seqs, counterfactuals, np.arange(num_rows), candidate_rows, candidate_positions, candidate_states)
+            edit_rows = candidate_rows[is_viable]
+            if not len(edit_rows):
+                break
+            candidates = counterfactuals[edit_rows]
+            candidates[np.arange(len(candidates)), candidate_positions[is_viable]] = candidate_states[is_viable]
+            seq_log_probs = np.concatenate([self.score_candidates(candidates[start:start + max_candidates]) for start in range(0, len(candidates), max_candidates)])
+            # Highest score per row: sort by row and descending score, then take the first entry of every row
+            order = np.lexsort((-seq_log_probs, edit_rows))
+            edited_rows, first_in_row = np.unique(edit_rows[order], return_index=True)
+            counterfactuals[edited_rows] = candidates[order[first_in_row]]
+        return counterfactuals
+
+    def filter_edits(self, true_seqs: np.ndarray, beams: np.ndarray, beam_rows: np.ndarray, edit_beams: np.ndarray, edit_positions: np.ndarray, edit_states: np.ndarray) -> np.ndarray:
+        """Mask of the single position edits whose Damerau-Levenshtein similarity to the true sequence of their row reaches the threshold.
+
+        The Hamming distance of a beam to its true sequence changes by at most one per edit and bounds the edit distance from above.
+        Only edits that exceed the threshold with their Hamming distance need the exact distance.
+        """
+        seq_len = beams.shape[1]
+        originals = true_seqs[beam_rows]
+        true_states = originals[edit_beams, edit_positions]
+        distances = (beams != originals).sum(axis=-1)[edit_beams] - (beams[edit_beams, edit_positions] != true_states) + (edit_states != true_states)
+        is_viable = 1 - distances / seq_len >= self.threshold
+        is_uncertain = ~is_viable
+        if is_uncertain.any():
+            candidates = beams[edit_beams[is_uncertain]]
+            candidates[np.arange(len(candidates)), edit_positions[is_uncertain]] = edit_states[is_uncertain]
+            lengths = np.full(len(candidates), seq_len)
+            is_viable[is_uncertain] = damerau_levenshtein(originals[edit_beams[is_uncertain]], lengths, candidates, lengths) >= self.threshold
+        return is_viable
+
+    def score_candidates(self, candidates: np.ndarray) -> np.ndarray:
+        predictions = self.model_wrapper.predict_sequence(candidates, batch_size=len(candidates))
+        multipliers = np.take_along_axis(predictions, candidates[..., None], axis=-1)[..., 0]
+        return np.log(multipliers).sum(axis=-1)
 
     def compute_sequence_metrics(self, true_seq: np.ndarray, counterfactual_seq: np.ndarray):
         true_seq_symbols = "".join([SYMBOL_MAPPING[idx] for idx in true_seq])
@@ -83,12 +146,29 @@ class HeuristicGenerator():
         return dict_instance_distances
 
 
+def benchmark_counterfactual_search(generator: HeuristicGenerator, true_seqs: np.ndarray, desired_outcome: int):
+    start_time = time.perf_counter()
+    iterative_results = generator.generate_counterfactual(true_seqs, desired_outcome)
+    iterative_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    batched_results = generator.generate_counterfactuals(true_seqs, desired_outcome)
+    batched_time = time.perf_counter() - start_time
+    return {
+        "num_sequences": len(true_seqs),
+        "iterative_cf_per_sec": len(true_seqs) / iterative_time,
+        "batched_cf_per_sec": len(true_seqs) / batched_time,
+        "speedup": iterative_time / batched_time,
+        "num_equal": int(np.all(iterative_results == batched_results, axis=-1).sum()),
+    }
+
+
 if __name__ == "__main__":
     reader = Reader().init_data()
-    sample = next(iter(reader.get_dataset().batch(15)))[0][0]
-    example = sample[4]
+    sample = reader.get_split_arrays()[0][0].astype(int)
+    examples = sample[np.any(sample == reader.end_id, axis=-1)][:15]
     predictor = ModelWrapper(reader).load_model_by_num(1)  # 1
     generator = HeuristicGenerator(reader, predictor)
     # print(example[0][0])
 
-    print(generator.generate_counterfactual(example, 6))  # 6, 15, 18 | 8
+    print(generator.generate_counterfactuals(examples[4], 6))  # 6, 15, 18 | 8
+    print(benchmark_counterfactual_search(generator, examples, 6))
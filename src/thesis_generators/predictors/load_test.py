@@ -0,0 +1,59 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import List
+
+import numpy as np
+from thesis_readers import AbstractProcessLogReader
+from thesis_readers import DomesticDeclarationsLogReader as Reader
+
+from thesis_generators.predictors.server import DEFAULT_HOST, DEFAULT_PORT, PredictionModes
+
+
+def sample_prefixes(reader: AbstractProcessLogReader, num_prefixes: int = 1000) -> List[List[str]]:
+    # Random cuts of real traces, decoded back into activity names like a client would send them
+    events = reader.get_split_arrays()[0][0].astype(int)
+    special_ids = [reader.vocab2idx[reader.padding_token], reader.start_id, reader.end_id]
+    traces = [[reader.idx2vocab[idx] for idx in row if idx not in special_ids] for row in events]
+    traces = [trace for trace in traces if trace]
+    rows = np.random.randint(0, len(traces), num_prefixes)
+    return [traces[row][:np.random.randint(1, len(traces[row]) + 1)] for row in rows]
+
+
+async def _client(prefixes: List[List[str]], mode: PredictionModes, host: str, port: int, latencies: List[float], errors: List[str]):
+    # One connection per simulated client that sends its next request once the previous one is answered
+    reader, writer = await asyncio.open_connection(host, port)
+    for request_id, prefix in enumerate(prefixes):
+        start_time = time.perf_counter()
+        writer.write((json.dumps({"id": request_id, "prefix": prefix, "mode": mode.value}) + "\n").encode())
+        response = json.loads(await reader.readline())
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        if "error" in response:
+            errors.append(response["error"])
+    writer.close()
+
+
+async def run_load_test(prefixes: List[List[str]], num_clients: int = 32, mode: PredictionModes = PredictionModes.NEXT_ACTIVITY, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> dict:
+    latencies, errors = [], []
+    start_time = time.perf_counter()
+    await asyncio.gather(*[_client(prefixes[client::num_clients], mode, host, port, latencies, errors) for client in range(num_clients)])
+    duration = time.perf_counter() - start_time
+    return {
+        "mode": mode.value,
+        "num_clients": num_clients,
+        "num_requests": len(latencies),
+        "num_errors": len(errors),
+        "requests_per_sec": len(latencies) / duration,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(np.max(latencies)),
+    }
+
+
+if __name__ == "__main__":
+    # Expects a running server, see server.py
+    reader = Reader().init_data()
+    prefixes = sample_prefixes(reader, 2000)
+    for mode, num_clients in itertools.product(PredictionModes, [1, 8, 64]):
+        print(asyncio.run(run_load_test(prefixes if mode == PredictionModes.NEXT_ACTIVITY else prefixes[:200], num_clients, mode)))
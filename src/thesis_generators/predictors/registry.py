@@ -0,0 +1,112 @@
+import io
+import json
+import pathlib
+import time
+from collections import OrderedDict
+from typing import Dict, List, Union
+
+import pandas as pd
+from tensorflow import keras
+from tensorflow.keras import Model
+from thesis_readers.readers.AbstractProcessLogReader import FeatureModes
+
+from thesis_predictors.helper import metrics
+from thesis_predictors.helper.constants import MODEL_FOLDER
+
+
+class RegisteredModel():
+    """A model folder written by Runner.save_model, which is named {prefix}_{label} and holds a history.json next to the SavedModel."""
+    def __init__(self, path: pathlib.Path):
+        self.path = pathlib.Path(path)
+        self.name = self.path.name
+        self.prefix, _, self.label = self.name.partition("_")
+        history_file = self.path / "history.json"
+        self.metadata = json.load(io.open(history_file)) if history_file.exists() else {}
+        # Models saved before the feature mode was recorded fall back to the mode of the wrapper
+        ft_mode = self.metadata.get("ft_mode")
+        self.ft_mode = FeatureModes[ft_mode] if ft_mode else None
+
+    def summary(self) -> dict:
+        history = self.metadata.get("history", {})
+        return {
+            "name": self.name,
+            "prefix": self.prefix,
+            "label": self.label,
+            "ft_mode": self.ft_mode.name if self.ft_mode else None,
+            "epochs": len(history.get("epochs", [])),
+            **{f"last_{key}": val[-1] for key, val in history.items() if key != "epochs" and val},
+        }
+
+
+class ModelRegistry():
+    """Index of MODEL_FOLDER that loads models on first use and keeps the max_loaded most recently used ones in memory."""
+    loss_fn = metrics.SparseCrossEntropyLoss()
+    metric = metrics.SparseAccuracyMetric()
+
+    def __init__(self, model_folder: pathlib.Path = MODEL_FOLDER, max_loaded: int = 2):
+        assert max_loaded > 0, f"The registry has to keep at least one model loaded, not {max_loaded}"
+        self.model_folder = pathlib.Path(model_folder)
+        self.max_loaded = max_loaded
+        self.loaded_models: Dict[str, Model] = OrderedDict()
+        self.load_seconds: Dict[str, List[float]] = {}
+        self.refresh()
+
+    def refresh(self):
+        self.entries: Dict[str, RegisteredModel] = {path.name: RegisteredModel(path) for path in sorted(self.model_folder.iterdir()) if path.is_dir()}
+        return self
+
+    def add_path(self, model_path: pathlib.Path) -> RegisteredModel:
+        # Folders outside of model_folder are registered under their name as well
+        entry = RegisteredModel(model_path)
+        self.entries[entry.name] = entry
+        return entry
+
+    def get_entry(self, key: Union[int, str]) -> RegisteredModel:
+        """Finds a model by its position in the index, its folder name or its label."""
+        if isinstance(key, int):
+            return list(self.entries.values())[key]
+        if key in self.entries:
+            return self.entries[key]
+        matches = [entry for entry in self.entries.values() if entry.label == key]
+        assert len(matches) == 1, f"Expected one model labeled {key} but found {[entry.name for entry in matches]}"
+        return matches[0]
+
+    def load(self, key: Union[int, str]) -> Model:
+        entry = self.get_entry(key)
+        if entry.name in self.loaded_models:
+            self.loaded_models.move_to_end(entry.name)
+            return self.loaded_models[entry.name]
+        start_time = time.perf_counter()
+        model = keras.models.load_model(entry.path, custom_objects={'SparseCrossEntropyLoss': self.loss_fn, 'SparseAccuracyMetric': self.metric})
+        load_seconds = time.perf_counter() - start_time
+        self.load_seconds.setdefault(entry.name, []).append(load_seconds)
+        print(f"Loaded {entry.name} in {load_seconds:.2f}s")
+        self.loaded_models[entry.name] = model
+        while len(self.loaded_models) > self.max_loaded:
+            evicted_name, _ = self.loaded_models.popitem(last=False)
+            print(f"Evicted {evicted_name}")
+        return model
+
+    def is_loaded(self, key: Union[int, str]) -> bool:
+        return self.get_entry(key).name in self.loaded_models
+
+    def report(self) -> pd.DataFrame:
+        rows = []
+        for name, entry in self.entries.items():
+            load_seconds = self.load_seconds.get(name, [])
+            rows.append({
+                **entry.summary(),
+                "is_loaded": name in self.loaded_models,
+                "num_loads": len(load_seconds),
+                "last_load_seconds": load_seconds[-1] if load_seconds else None,
+                "total_load_seconds": sum(load_seconds),
+            })
+        return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    registry = ModelRegistry()
+    print(registry.report())
+    for key in list(registry.entries)[:3] * 2:
+        registry.load(key)
+    print(registry.report()[["name", "is_loaded", "num_loads", "last_load_seconds"]])
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import List, Tuple
+
+import numpy as np
+from thesis_readers import AbstractProcessLogReader
+from thesis_readers import DomesticDeclarationsLogReader as Reader
+
+from thesis_generators.predictors.wrapper import ModelWrapper
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class PredictionModes(Enum):
+    NEXT_ACTIVITY = "next"
+    SUFFIX = "suffix"
+
+
+class MicroBatcher():
+    """Collects the sequences of concurrent requests into batches of up to max_batch_size and waits at most max_wait_ms for a batch to fill."""
+    def __init__(self, model_wrapper: ModelWrapper, max_batch_size: int = 64, max_wait_ms: float = 5):
+        self.model_wrapper = model_wrapper
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.queue: asyncio.Queue = None
+        # Tensorflow blocks, so the model runs in its own thread while the event loop keeps collecting requests
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.statistics = {"num_batches": 0, "num_sequences": 0}
+
+    async def predict(self, sequence: np.ndarray) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((sequence, future))
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def start(self) -> asyncio.Future:
+        # The queue is created here, so it belongs to the running event loop
+        self.queue = asyncio.Queue()
+        return asyncio.ensure_future(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            sequences = np.stack([sequence for sequence, _ in batch])
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.model_wrapper.predict_sequence, sequences)
+            except Exception as e:
+                # Futures of clients that disconnected are cancelled and must not be set, or the batcher dies with InvalidStateError
+                for _, future in batch:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                continue
+            self.statistics["num_batches"] += 1
+            self.statistics["num_sequences"] += len(batch)
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.cancelled():
+                    future.set_result(prediction)
+
+
+class PredictionServer():
+    """Serves next activity and suffix predictions over TCP. Every line is a JSON request and gets a JSON response line with the same id.
+
+    Request: {"id": 1, "prefix": ["activity a", "activity b"], "mode": "next" | "suffix", "max_suffix_len": 10}
+    Response: {"id": 1, "next_activity": "activity c", "probability": 0.9} or {"id": 1, "suffix": ["activity c", "<E>"]}
+    """
+    def __init__(self, reader: AbstractProcessLogReader, model_wrapper: ModelWrapper, max_batch_size: int = 64, max_wait_ms: float = 5):
+        self.reader = reader
+        self.batcher = MicroBatcher(model_wrapper, max_batch_size, max_wait_ms)
+        self.max_len = reader.max_len
+        # A suffix ends with the end token or with padding, if the model sees no further activity
+        self.stop_ids = [self.reader.vocab2idx[self.reader.padding_token], self.reader.end_id]
+
+    def encode(self, prefix: List[str]) -> np.ndarray:
+        unknown = [activity for activity in prefix if activity not in self.reader.vocab2idx]
+        if unknown:
+            raise ValueError(f"Unknown activities {unknown}")
+        # Right aligned like the reader's traces with the start token in front of the first event. Longer prefixes keep their last events.
+        ids = [self.reader.start_id] + [self.reader.vocab2idx[activity] for activity in prefix]
+        sequence = np.zeros(self.max_len, dtype=int)
+        ids = ids[-self.max_len:]
+        sequence[self.max_len - len(ids):] = ids
+        return sequence
+
+    def decode(self, ids: List[int]) -> List[str]:
+        return [self.reader.idx2vocab[idx] for idx in ids]
+
+    async def predict_next(self, sequence: np.ndarray) -> Tuple[int, float]:
+        # The output at the last position is the distribution of the activity that follows the prefix
+        prediction = await self.batcher.predict(sequence)
+        next_id = int(prediction[-1].argmax())
+        return next_id, float(prediction[-1, next_id])
+
+    async def predict_suffix(self, sequence: np.ndarray, max_suffix_len: int = None) -> List[int]:
+        # Every step is a separate request to the batcher, so the steps of concurrent suffixes share batches
+        suffix = []
+        for _ in range(max_suffix_len or self.max_len):
+            next_id, _ = await self.predict_next(sequence)
+            suffix.append(next_id)
+            if next_id in self.stop_ids:
+                break
+            sequence = np.append(sequence[1:], next_id)
+        return suffix
+
+    async def handle_request(self, request: dict) -> dict:
+        # Client input is validated with exceptions, asserts are stripped under python -O
+        if not isinstance(request, dict) or "prefix" not in request:
+            raise ValueError(f"Expected a request with a prefix, got {request}")
+        mode = PredictionModes(request.get("mode", PredictionModes.NEXT_ACTIVITY.value))
+        sequence = self.encode(request["prefix"])
+        if mode == PredictionModes.SUFFIX:
+            return {"suffix": self.decode(await self.predict_suffix(sequence, request.get("max_suffix_len")))}
+        next_id, probability = await self.predict_next(sequence)
+        return {"next_activity": self.reader.idx2vocab[next_id], "probability": probability}
+
+    async def _respond(self, line: bytes, writer: asyncio.StreamWriter):
+        request = {}
+        start_time = time.perf_counter()
+        try:
+            request = json.loads(line)
+            response = await self.handle_request(request)
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        response.update(id=request.get("id") if isinstance(request, dict) else None, server_ms=(time.perf_counter() - start_time) * 1000)
+        writer.write((json.dumps(response) + "\n").encode())
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Requests of one connection are answered as they finish, clients match them by id
+        pending = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            task = asyncio.ensure_future(self._respond(line, writer))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+        writer.close()
+        await writer.wait_closed()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        batcher_task = self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving predictions on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+
+
+if __name__ == "__main__":
+    reader = Reader().init_data()
+    model_wrapper = ModelWrapper(reader)
+    asyncio.run(PredictionServer(reader, model_wrapper).serve())
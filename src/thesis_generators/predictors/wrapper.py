@@ -1,49 +1,150 @@
-from typing import List
+import time
+from typing import Callable, Dict, List, Tuple
 import numpy as np
 from tensorflow.keras import Model
 from thesis_readers import VolvoIncidentsReader, RequestForPaymentLogReader, BPIC12LogReader, AbstractProcessLogReader
+from thesis_readers.readers.AbstractProcessLogReader import DatasetModes, FeatureModes
 from tensorflow import keras
 import tensorflow as tf
 import pathlib
 import os
 import io
 
-from thesis_predictors.helper import metrics
-from thesis_predictors.helper.constants import MODEL_FOLDER
+from thesis_generators.predictors.registry import ModelRegistry
 
+# Feature modes whose model input starts with the one-hot encoded events instead of the event ids
+ONE_HOT_MODES = [FeatureModes.EVENT_ONLY_ONEHOT, FeatureModes.EVENT_TIME, FeatureModes.FULL]
 
-class ModelWrapper():
-    prediction_model: Model = None
-    loss_fn = metrics.SparseCrossEntropyLoss()
-    metric = metrics.SparseAccuracyMetric()
 
-    def __init__(self, reader: AbstractProcessLogReader, model_num = None) -> None:
+class ModelWrapper():
+    def __init__(self, reader: AbstractProcessLogReader, model_num=None, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY, registry: ModelRegistry = None) -> None:
         self.reader = reader
-        self.model_num = model_num or 0
-        self.model_dirs = [x for  x in MODEL_FOLDER.iterdir() if x.is_dir()]
-        self.load_model_by_num(self.model_num)
+        # Used for models whose history.json does not record the feature mode they were trained with
+        self.default_ft_mode = ft_mode
+        self.registry = registry or ModelRegistry()
+        self.input_specs: Dict[FeatureModes, Tuple[tf.TensorSpec]] = {}
+        # One set of zero feature buffers per feature mode and sequence length, as large as the largest batch so far
+        self.zero_buffers: Dict[tuple, Tuple[tf.Tensor]] = {}
+        self.forwards: Dict[str, Tuple[Model, Callable]] = {}
+        self.load_model_by_num(model_num or 0)
 
-    def load_model_by_path(self, model_path: pathlib.Path):
-        self.model_path = model_path
-        self.prediction_model = keras.models.load_model(self.model_path, custom_objects={'SparseCrossEntropyLoss': self.loss_fn, 'SparseAccuracyMetric': self.metric})
+    def load_model_by_name(self, model_name: str):
+        # Only selects the model, the registry loads it on the first prediction
+        self.model_entry = self.registry.get_entry(model_name)
+        self.model_path = self.model_entry.path
         return self
 
+    def load_model_by_path(self, model_path: pathlib.Path):
+        return self.load_model_by_name(self.registry.add_path(model_path).name)
+
     def load_model_by_num(self, model_num: int):
         self.model_num = model_num
-        return self.load_model_by_path(self.model_dirs[self.model_num])
+        return self.load_model_by_name(self.registry.get_entry(model_num).name)
+
+    @property
+    def ft_mode(self) -> FeatureModes:
+        return self.model_entry.ft_mode or self.default_ft_mode
+
+    @property
+    def input_spec(self) -> Tuple[tf.TensorSpec]:
+        ft_mode = self.ft_mode
+        if ft_mode not in self.input_specs:
+            assert ft_mode != FeatureModes.FEATURES_ONLY, f"{ft_mode} has no event input to feed the sequences into"
+            # Building a dataset only to read its shapes is expensive, hence the spec is read once per feature mode
+            input_spec = self.reader.get_dataset(1, DatasetModes.TEST, ft_mode).element_spec[0]
+            self.input_specs[ft_mode] = tuple(input_spec) if isinstance(input_spec, tuple) else (input_spec, )
+        return self.input_specs[ft_mode]
+
+    @property
+    def prediction_model(self) -> Model:
+        return self.registry.load(self.model_entry.name)
+
+    @property
+    def forward(self) -> Callable:
+        model = self.prediction_model
+        # A compiled forward holds on to its model, so the ones of models the registry evicted or reloaded are dropped
+        self.forwards = {name: (fn_model, fn) for name, (fn_model, fn) in self.forwards.items() if self.registry.loaded_models.get(name) is fn_model}
+        if self.model_entry.name not in self.forwards:
+            self.forwards[self.model_entry.name] = (model, self._compile_forward(model))
+        return self.forwards[self.model_entry.name][1]
+
+    def _feature_shapes(self) -> List[tuple]:
+        # Trailing dims of every input that is fed with zeros. One-hot modes concatenate those features to the encoded events.
+        if self.ft_mode in ONE_HOT_MODES:
+            num_features = self.input_spec[0].shape[-1] - self.reader.onehot_len
+            return [(num_features, )] if num_features else []
+        return [tuple(spec.shape[2:]) for spec in self.input_spec[1:]]
 
-    def prepare_input(self, example):
-        structure = self.reader.get_dataset()._structure[0]
+    def _input_assembler(self):
+        # Turns the event ids and zero feature buffers into the structure the current model was trained on
+        is_one_hot, onehot_len, event_dtype = self.ft_mode in ONE_HOT_MODES, self.reader.onehot_len, self.input_spec[0].dtype
 
-        shape_batch = (example.shape[0], )
-        return (
-            tf.constant(example, dtype=tf.float32),
-            tf.zeros(shape_batch + structure[1].shape[1:]),
-            tf.zeros(shape_batch + structure[2].shape[1:]),
-            tf.zeros(shape_batch + structure[3].shape[1:]),
-        )
+        def assemble_inputs(events: tf.Tensor, features: Tuple[tf.Tensor]):
+            # The zero buffers may hold more rows than the batch
+            features = tuple(feature[:tf.shape(events)[0]] for feature in features)
+            if is_one_hot:
+                encoded = tf.one_hot(events, onehot_len, dtype=tf.float32)
+                return tf.concat([encoded, *features], axis=-1) if features else encoded
+            events = tf.cast(events, event_dtype)
+            return (events, *features) if features else events
 
-    def predict_sequence(self, sequence) -> np.ndarray:
+        return assemble_inputs
+
+    def assemble_inputs(self, events: tf.Tensor, features: Tuple[tf.Tensor]):
+        return self._input_assembler()(events, features)
+
+    def _compile_forward(self, model: Model):
+        feature_specs = tuple(tf.TensorSpec((None, None) + shape, tf.float32) for shape in self._feature_shapes())
+        assemble_inputs = self._input_assembler()
+
+        # A fixed signature with open batch and sequence dims, so the graph is traced only once
+        @tf.function(input_signature=[tf.TensorSpec((None, None), tf.int32), feature_specs])
+        def forward(events, features):
+            return model(assemble_inputs(events, features), training=False)
+
+        return forward
+
+    def prepare_input(self, example) -> Tuple[tf.Tensor, Tuple[tf.Tensor]]:
+        batch_size, seq_len = example.shape[:2]
+        key = (self.ft_mode, seq_len)
+        buffers = self.zero_buffers.get(key)
+        if buffers is None or (buffers and buffers[0].shape[0] < batch_size):
+            self.zero_buffers[key] = tuple(tf.zeros((batch_size, seq_len) + shape) for shape in self._feature_shapes())
+        return tf.constant(example, dtype=tf.int32), self.zero_buffers[key]
+
+    def predict_sequence(self, sequence, batch_size: int = None) -> np.ndarray:
         sequence = sequence[None] if sequence.ndim < 2 else sequence
-        input_for_prediction = self.prepare_input(sequence)
-        return self.prediction_model.predict(input_for_prediction)
+        batch_size = batch_size or len(sequence)
+        if len(sequence) <= batch_size:
+            return self.forward(*self.prepare_input(sequence)).numpy()
+        return np.concatenate([self.forward(*self.prepare_input(sequence[start:start + batch_size])).numpy() for start in range(0, len(sequence), batch_size)])
+
+
+def benchmark_prediction_latency(model_wrapper: ModelWrapper, batch_sizes: List[int] = [1, 8, 64], repeats: int = 100):
+    results = []
+    for batch_size in batch_sizes:
+        sequences = np.random.randint(0, model_wrapper.reader.onehot_len, (batch_size, model_wrapper.reader.max_len))
+        # The first calls trace the graph and fill the zero buffers
+        model_wrapper.predict_sequence(sequences)
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            model_wrapper.predict_sequence(sequences)
+        compiled_ms = (time.perf_counter() - start_time) / repeats * 1000
+        model_inputs = model_wrapper.assemble_inputs(*model_wrapper.prepare_input(sequences))
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            model_wrapper.prediction_model.predict(model_inputs, verbose=0)
+        predict_ms = (time.perf_counter() - start_time) / repeats * 1000
+        results.append({"batch_size": batch_size, "compiled_forward_ms": compiled_ms, "model_predict_ms": predict_ms})
+    return results
+
+
+if __name__ == "__main__":
+    reader = RequestForPaymentLogReader().init_data()
+    wrapper = ModelWrapper(reader)
+    for result in benchmark_prediction_latency(wrapper):
+        print(result)
+    # Switching back and forth only loads every model once, as long as they fit into the registry
+    for model_num in [0, 1, 0, 1]:
+        wrapper.load_model_by_num(model_num).predict_sequence(np.zeros((1, reader.max_len), dtype=int))
+    print(wrapper.registry.report())
@@ -0,0 +1,137 @@
+from enum import Enum
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from thesis_predictors.evaluation.sequence_metrics import SEQUENCE_METRICS, compute_sequence_metrics_batch
+
+# Nothing in this package imports tensorflow, so the spawned evaluation workers start without it. The helper package sets up the GPU on import.
+SEQUENCE_LENGTH = "seq_len"
+TRADITIONAL_METRICS = ["acc", "recall", "precision", "f1"]
+ALL_METRICS = TRADITIONAL_METRICS + list(SEQUENCE_METRICS.keys())
+ID_COLUMNS = ["input_ids", "true_ids", "pred_ids"]
+
+
+class DecodingModes(Enum):
+    IDS = "ids"  # Keeps the id arrays, decode_results builds the strings on demand
+    STRINGS = "strings"
+    NONE = "none"
+
+# Set once per worker by the pool initializer, so chunks only carry the int arrays
+_worker_state = {}
+
+
+def compute_traditional_metrics_batch(y_true: np.ndarray, y_pred: np.ndarray, start: np.ndarray = None, mode='weighted', metrics: List[str] = None) -> Dict[str, np.ndarray]:
+    """Row wise version of compute_traditional_metrics with sklearn's semantics. Per row only the columns from start onwards are used."""
+    assert mode in ['weighted', 'macro', 'micro'], f"Averaging mode {mode} is not supported"
+    metrics = TRADITIONAL_METRICS if metrics is None else metrics
+    num_rows, num_cols = y_true.shape
+    start = np.zeros(num_rows, dtype=np.int64) if start is None else start
+    is_valid = np.arange(num_cols) >= start[:, None]
+    num_labels = int(max(y_true.max(initial=0), y_pred.max(initial=0))) + 1
+    # Confusion counts per (row, label) pair, flattened into one bincount each
+    label_offsets = np.arange(num_rows)[:, None] * num_labels
+    count = lambda labels, mask: np.bincount((label_offsets + labels)[mask], minlength=num_rows * num_labels).reshape(num_rows, num_labels)
+    true_counts, pred_counts = count(y_true, is_valid), count(y_pred, is_valid)
+    true_positives = count(y_true, is_valid & (y_true == y_pred))
+
+    accuracy = true_positives.sum(axis=1) / np.maximum(is_valid.sum(axis=1), 1)
+    if mode == 'micro':
+        precision = recall = f1 = accuracy
+    else:
+        # Labels that occur in neither sequence get no weight, just like sklearn only considers the labels present
+        weights = true_counts if mode == 'weighted' else (true_counts + pred_counts > 0)
+        average = lambda per_label: np.sum(per_label * weights, axis=1) / np.maximum(weights.sum(axis=1), 1)
+        precision = average(true_positives / np.maximum(pred_counts, 1))
+        recall = average(true_positives / np.maximum(true_counts, 1))
+        f1 = average(2 * true_positives / np.maximum(true_counts + pred_counts, 1))
+    all_metrics = {"acc": accuracy, "recall": recall, "precision": precision, "f1": f1}
+    return {name: all_metrics[name] for name in TRADITIONAL_METRICS if name in metrics}
+
+
+def _expand_prefixes(ids, idx2vocab=None):
+    x_convert = [f"{i:03d}" for i in ids]
+    return " | ".join(["-".join(x_convert[:lim + 1]) for lim in range(len(x_convert))])
+
+
+def _encode(ids, idx2vocab=None):
+    return " -> ".join([f"{i:03d}" for i in ids])
+
+
+def _decode(ids, idx2vocab):
+    return " -> ".join([idx2vocab[i] for i in ids])
+
+
+DECODING_COLUMNS = {
+    "input": ("input_ids", _expand_prefixes),
+    "true_encoded": ("true_ids", _encode),
+    "pred_encoded": ("pred_ids", _encode),
+    "true_encoded_with_padding": ("true_ids", _encode),
+    "pred_encoded_with_padding": ("pred_ids", _encode),
+    "true_decoded": ("true_ids", _decode),
+    "pred_decoded": ("pred_ids", _decode),
+}
+
+
+def compute_decoding(idx2vocab, row_y_pred, row_y_test, row_x_test):
+    row_ids = {"input_ids": row_x_test, "true_ids": row_y_test, "pred_ids": row_y_pred}
+    return {name: decode_fn(row_ids[id_col], idx2vocab) for name, (id_col, decode_fn) in DECODING_COLUMNS.items()}
+
+
+def decode_results(results: pd.DataFrame, idx2vocab: Dict[int, str] = None, columns: List[str] = None, keep_ids: bool = False) -> pd.DataFrame:
+    """Adds the string columns of compute_decoding to results evaluated with DecodingModes.IDS. Only the requested columns are built."""
+    idx2vocab = idx2vocab or results.attrs["idx2vocab"]
+    columns = list(DECODING_COLUMNS.keys()) if columns is None else columns
+    decoded = results.copy() if keep_ids else results.drop(columns=ID_COLUMNS)
+    for name in columns:
+        id_col, decode_fn = DECODING_COLUMNS[name]
+        decoded[name] = [decode_fn(ids, idx2vocab) for ids in results[id_col]]
+    return decoded
+
+
+def evaluate_chunk(idx2vocab, x_test, y_test, y_pred, offset=0, mode='weighted', metrics: List[str] = None, decoding: DecodingModes = DecodingModes.IDS) -> pd.DataFrame:
+    metrics = ALL_METRICS if metrics is None else metrics
+    all_first_word_test = np.maximum(np.argmin(y_test == 0, axis=-1), 1)
+    all_first_word_pred = np.maximum(np.argmin(y_pred == 0, axis=-1), 1)
+    all_first_word_x = np.argmin(x_test == 0, axis=-1)
+    # Keeps the argument order of compute_traditional_metrics, which passes the prediction as sklearn's y_true
+    traditional_metrics = compute_traditional_metrics_batch(
+        y_pred,
+        y_test,
+        np.minimum(all_first_word_test, all_first_word_pred),
+        mode,
+        [name for name in metrics if name in TRADITIONAL_METRICS],
+    )
+    sequence_metrics = compute_sequence_metrics_batch(
+        [row[first_word:] for row, first_word in zip(y_test, all_first_word_test)],
+        [row[-first_word:] for row, first_word in zip(y_pred, all_first_word_pred)],
+        [name for name in metrics if name in SEQUENCE_METRICS],
+    )
+    results = pd.DataFrame({
+        "trace": offset + np.arange(len(y_test)),
+        f"full_{SEQUENCE_LENGTH}": y_test.shape[1] - all_first_word_test,
+        f"input_x_{SEQUENCE_LENGTH}": x_test.shape[1] - all_first_word_x,
+        f"true_y_{SEQUENCE_LENGTH}": y_test.shape[1] - all_first_word_test,
+        f"pred_y_{SEQUENCE_LENGTH}": y_pred.shape[1] - all_first_word_pred,
+        **traditional_metrics,
+        **sequence_metrics,
+    })
+    if decoding == DecodingModes.NONE:
+        return results
+    id_dtype = np.int16 if len(idx2vocab) <= np.iinfo(np.int16).max else np.int32
+    results["input_ids"] = [row[first_word:].astype(id_dtype) for row, first_word in zip(x_test, all_first_word_x)]
+    results["true_ids"] = [row[first_word:].astype(id_dtype) for row, first_word in zip(y_test, all_first_word_test)]
+    results["pred_ids"] = [row[first_word:].astype(id_dtype) for row, first_word in zip(y_pred, all_first_word_pred)]
+    if decoding == DecodingModes.STRINGS:
+        return decode_results(results, idx2vocab)
+    return results
+
+
+def _init_worker(idx2vocab, mode, metrics, decoding):
+    _worker_state.update(idx2vocab=idx2vocab, mode=mode, metrics=metrics, decoding=decoding)
+
+
+def _evaluate_chunk_star(args):
+    state = _worker_state
+    return evaluate_chunk(state["idx2vocab"], *args, mode=state["mode"], metrics=state["metrics"], decoding=state["decoding"])
@@ -0,0 +1,216 @@
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+import numpy as np
+
+# Vectorized versions of the textdistance similarities used in helper.evaluation.compute_sequence_metrics.
+# Every metric works on a whole batch of integer id sequences. The sequences are left aligned in a padded matrix and their lengths are passed along,
+# so ids may take any non negative value including the padding id 0. The dynamic programs loop over the rows of the DP matrix only.
+# The dependency of a cell on its left neighbour is resolved with a cumulative min/max over each row.
+# Normalizations and edge cases follow textdistance 4.2.2 without external libraries (damerau_levenshtein is the restricted/optimal string alignment variant).
+
+PAD = -1
+
+
+def pad_sequences(sequences: Sequence[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    lengths = np.array([len(seq) for seq in sequences], dtype=np.int64)
+    padded = np.full((len(sequences), max(lengths.max(initial=0), 1)), PAD, dtype=np.int64)
+    if lengths.sum():
+        padded[np.arange(padded.shape[1]) < lengths[:, None]] = np.concatenate([np.asarray(seq, dtype=np.int64) for seq in sequences])
+    return padded, lengths
+
+
+def _normalize(values: np.ndarray, maximum: np.ndarray, default: float = 1.0) -> np.ndarray:
+    # textdistance skips the division and returns a fixed value whenever the maximum is 0
+    return np.where(maximum == 0, default, values / np.maximum(maximum, 1))
+
+
+def _edit_distance(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray, with_transpositions: bool = False) -> np.ndarray:
+    num_rows, cols = len(a), np.arange(b.shape[1] + 1)
+    prev_prev, prev = None, np.broadcast_to(cols, (num_rows, len(cols))).copy()
+    result = len_b.copy()
+    for i in range(1, a.shape[1] + 1):
+        cost = (b != a[:, i - 1:i]).astype(np.int64)
+        candidates = np.empty_like(prev)
+        candidates[:, 0] = i
+        candidates[:, 1:] = np.minimum(prev[:, 1:] + 1, prev[:, :-1] + cost)
+        if with_transpositions and i > 1:
+            is_swapped = (a[:, i - 1:i] == b[:, :-1]) & (a[:, i - 2:i - 1] == b[:, 1:])
+            candidates[:, 2:] = np.where(is_swapped, np.minimum(candidates[:, 2:], prev_prev[:, :-2] + cost[:, 1:]), candidates[:, 2:])
+        # cur[j] = min(candidates[j], cur[j - 1] + 1)
+        cur = np.minimum.accumulate(candidates - cols, axis=1) + cols
+        result = np.where(len_a == i, cur[np.arange(num_rows), len_b], result)
+        prev_prev, prev = prev, cur
+    return result
+
+
+def _alignment_score(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray, is_local: bool) -> np.ndarray:
+    # Match scores 1, mismatch 0 and every gap costs 1
+    num_rows, cols = len(a), np.arange(b.shape[1] + 1)
+    prev = np.zeros((num_rows, len(cols))) if is_local else np.broadcast_to(-cols, (num_rows, len(cols))).astype(float)
+    result = prev[np.arange(num_rows), len_b]
+    for i in range(1, a.shape[1] + 1):
+        is_match = (b == a[:, i - 1:i]).astype(float)
+        candidates = np.empty_like(prev)
+        candidates[:, 0] = 0 if is_local else -i
+        candidates[:, 1:] = np.maximum(prev[:, :-1] + is_match, prev[:, 1:] - 1)
+        if is_local:
+            candidates = np.maximum(candidates, 0)
+        # cur[j] = max(candidates[j], cur[j - 1] - 1)
+        cur = np.maximum.accumulate(candidates + cols, axis=1) - cols
+        result = np.where(len_a == i, cur[np.arange(num_rows), len_b], result)
+        prev = cur
+    return result
+
+
+def _symbol_counts(a: np.ndarray, len_a: np.ndarray, num_symbols: int) -> np.ndarray:
+    rows, positions = np.nonzero(np.arange(a.shape[1]) < len_a[:, None])
+    return np.bincount(rows * num_symbols + a[rows, positions], minlength=len(a) * num_symbols).reshape(len(a), num_symbols)
+
+
+def levenshtein(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    return 1 - _normalize(_edit_distance(a, len_a, b, len_b), np.maximum(len_a, len_b), 0.0)
+
+
+def damerau_levenshtein(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    return 1 - _normalize(_edit_distance(a, len_a, b, len_b, True), np.maximum(len_a, len_b), 0.0)
+
+
+def local_alignment(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    # Like textdistance this is the score of the bottom right cell and not the maximum over the matrix
+    return _normalize(_alignment_score(a, len_a, b, len_b, True), np.minimum(len_a, len_b))
+
+
+def global_alignment(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    max_len = np.maximum(len_a, len_b)
+    return _normalize(_alignment_score(a, len_a, b, len_b, False) + max_len, 2 * max_len)
+
+
+def longest_subsequence(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    num_rows = len(a)
+    prev = np.zeros((num_rows, b.shape[1] + 1), dtype=np.int64)
+    result = np.zeros(num_rows, dtype=np.int64)
+    for i in range(1, a.shape[1] + 1):
+        candidates = np.zeros_like(prev)
+        candidates[:, 1:] = np.maximum(prev[:, 1:], prev[:, :-1] + (b == a[:, i - 1:i]))
+        cur = np.maximum.accumulate(candidates, axis=1)
+        result = np.where(len_a == i, cur[np.arange(num_rows), len_b], result)
+        prev = cur
+    return _normalize(result, np.maximum(len_a, len_b))
+
+
+def longest_substring(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    num_rows = len(a)
+    is_valid_col = np.arange(b.shape[1]) < len_b[:, None]
+    prev = np.zeros((num_rows, b.shape[1] + 1), dtype=np.int64)
+    result = np.zeros(num_rows, dtype=np.int64)
+    for i in range(1, a.shape[1] + 1):
+        cur = np.zeros_like(prev)
+        cur[:, 1:] = np.where(b == a[:, i - 1:i], prev[:, :-1] + 1, 0)
+        result = np.where(len_a >= i, np.maximum(result, (cur[:, 1:] * is_valid_col).max(axis=1)), result)
+        prev = cur
+    return _normalize(result, np.maximum(len_a, len_b))
+
+
+def jaro_winkler(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray, prefix_weight: float = 0.1) -> np.ndarray:
+    num_rows, cols = len(a), np.arange(b.shape[1])
+    search_range = np.maximum(np.maximum(len_a, len_b) // 2 - 1, 0)[:, None]
+    a_flags = np.zeros(a.shape, dtype=bool)
+    b_flags = np.zeros(b.shape, dtype=bool)
+    # Every element of a takes the first unflagged equal element of b within the search range
+    for i in range(a.shape[1]):
+        is_candidate = (b == a[:, i:i + 1]) & ~b_flags & (np.abs(cols - i) <= search_range) & (cols < len_b[:, None]) & (i < len_a[:, None])
+        has_match = is_candidate.any(axis=1)
+        first_match = is_candidate.argmax(axis=1)
+        a_flags[has_match, i] = True
+        b_flags[has_match, first_match[has_match]] = True
+    num_common = a_flags.sum(axis=1)
+
+    # Transpositions are the mismatches between the flagged elements of a and b, both in their original order
+    a_common = np.take_along_axis(a, np.argsort(~a_flags, axis=1, kind='stable'), axis=1)
+    b_common = np.take_along_axis(b, np.argsort(~b_flags, axis=1, kind='stable'), axis=1)
+    width = min(a.shape[1], b.shape[1])
+    is_transposed = (a_common[:, :width] != b_common[:, :width]) & (np.arange(width) < num_common[:, None])
+    num_transpositions = is_transposed.sum(axis=1) // 2
+
+    safe_common = np.maximum(num_common, 1)
+    weight = (num_common / np.maximum(len_a, 1) + num_common / np.maximum(len_b, 1) + (num_common - num_transpositions) / safe_common) / 3
+    weight = np.where(num_common == 0, 0.0, weight)
+
+    prefix_width = min(width, 4)
+    is_prefix = np.cumprod(a[:, :prefix_width] == b[:, :prefix_width], axis=1).astype(bool) & (np.arange(prefix_width) < np.minimum(len_a, len_b)[:, None])
+    prefix_len = is_prefix.sum(axis=1)
+    weight = np.where(weight > 0.7, weight + prefix_len * prefix_weight * (1.0 - weight), weight)
+    return _with_quick_answer(weight, a, len_a, b, len_b)
+
+
+def overlap(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    num_symbols = int(max(a.max(initial=0), b.max(initial=0))) + 1
+    intersection = np.minimum(_symbol_counts(a, len_a, num_symbols), _symbol_counts(b, len_b, num_symbols)).sum(axis=1)
+    return _with_quick_answer(intersection / np.maximum(np.minimum(len_a, len_b), 1), a, len_a, b, len_b)
+
+
+def entropy(a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    # Entropy based normalized compression distance. The size of a sequence is 1 plus the entropy of its symbol counts.
+    num_symbols = int(max(a.max(initial=0), b.max(initial=0))) + 1
+    counts_a, counts_b = _symbol_counts(a, len_a, num_symbols), _symbol_counts(b, len_b, num_symbols)
+
+    def compressed_size(counts):
+        probs = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+        return 1 - np.sum(probs * np.log2(np.where(probs > 0, probs, 1)), axis=1)
+
+    size_a, size_b, size_ab = compressed_size(counts_a), compressed_size(counts_b), compressed_size(counts_a + counts_b)
+    return 1 - (size_ab - np.minimum(size_a, size_b)) / np.maximum(size_a, size_b)
+
+
+def _with_quick_answer(similarity: np.ndarray, a: np.ndarray, len_a: np.ndarray, b: np.ndarray, len_b: np.ndarray) -> np.ndarray:
+    # Identical sequences are maximally similar and a single empty sequence not at all
+    width = min(a.shape[1], b.shape[1])
+    is_identical = (len_a == len_b) & np.all((a[:, :width] == b[:, :width]) | (np.arange(width) >= len_a[:, None]), axis=1)
+    return np.where(is_identical, 1.0, np.where((len_a == 0) | (len_b == 0), 0.0, similarity))
+
+
+SEQUENCE_METRICS: Dict[str, Callable] = {
+    "levenshtein": levenshtein,
+    "damerau_levenshtein": damerau_levenshtein,
+    "local_alignment": local_alignment,
+    "global_alignment": global_alignment,
+    "emph_start": jaro_winkler,
+    "longest_subsequence": longest_subsequence,
+    "longest_substring": longest_substring,
+    "overlap": overlap,
+    "entropy": entropy,
+}
+
+
+def compute_sequence_metrics_batch(true_seqs: Sequence[np.ndarray], pred_seqs: Sequence[np.ndarray], metrics: List[str] = None) -> Dict[str, np.ndarray]:
+    """Batch version of helper.evaluation.compute_sequence_metrics. Returns one array of similarities per metric."""
+    true_padded, true_lengths = pad_sequences(true_seqs)
+    pred_padded, pred_lengths = pad_sequences(pred_seqs)
+    metrics = list(SEQUENCE_METRICS.keys()) if metrics is None else metrics
+    return {name: SEQUENCE_METRICS[name](true_padded, true_lengths, pred_padded, pred_lengths) for name in metrics}
+
+
+def benchmark_sequence_metrics(num_pairs: int = 2000, max_len: int = 40, vocab_len: int = 30, seed: int = 42):
+    from thesis_predictors.helper.evaluation import compute_sequence_metrics
+    rng = np.random.default_rng(seed)
+    true_seqs = [rng.integers(1, vocab_len, rng.integers(0, max_len)) for _ in range(num_pairs)]
+    # Predictions are noisy copies, so the similarities cover the whole range
+    pred_seqs = [np.where(rng.random(len(seq)) < 0.3, rng.integers(1, vocab_len, len(seq)), seq)[:rng.integers(0, max_len)] for seq in true_seqs]
+
+    start_time = time.perf_counter()
+    expected = [compute_sequence_metrics(true_seq, pred_seq) for true_seq, pred_seq in zip(true_seqs, pred_seqs)]
+    textdistance_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    results = compute_sequence_metrics_batch(true_seqs, pred_seqs)
+    vectorized_time = time.perf_counter() - start_time
+    return {
+        "num_pairs": num_pairs,
+        "textdistance_sec": textdistance_time,
+        "vectorized_sec": vectorized_time,
+        "speedup": textdistance_time / vectorized_time,
+        **{f"max_abs_diff_{name}": float(np.max(np.abs(values - [exp[name] for exp in expected]))) for name, values in results.items()},
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_sequence_metrics())
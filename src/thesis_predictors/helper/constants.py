@@ -1,6 +1,8 @@
 import pathlib
 import importlib_resources
 
+from thesis_predictors.evaluation.instance_metrics import SEQUENCE_LENGTH
+
 MODEL_FOLDER = importlib_resources.files(__package__).parent.parent.parent / "models"
 EVAL_RESULTS_FOLDER = importlib_resources.files(__package__).parent.parent.parent / "results"
 
@@ -9,5 +11,4 @@ print(f"Models: {MODEL_FOLDER}")
 print(f"Evaluation Results: {EVAL_RESULTS_FOLDER}")
 print("==============================================")
 
-SEQUENCE_LENGTH = "seq_len"
 NUMBER_OF_INSTANCES = 'num_instances'
\ No newline at end of file
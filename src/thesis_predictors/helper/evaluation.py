@@ -5,11 +5,13 @@ import tensorflow as tf
 import numpy as np
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.metrics import Accuracy
-from sklearn.metrics import accuracy_score, recall_score, precision_score, f1_score
 import pandas as pd
 from tqdm import tqdm
 import textdistance
 from ..helper.constants import NUMBER_OF_INSTANCES, SEQUENCE_LENGTH
+from ..helper.instance_evaluation import compute_traditional_metrics, evaluate_instances
+from thesis_predictors.evaluation.instance_metrics import DecodingModes, compute_traditional_metrics_batch
+from thesis_predictors.evaluation.sequence_metrics import damerau_levenshtein, pad_sequences
 from ..models.lstm import SimpleLSTMModelOneWay
 from ..models.transformer import TransformerModelOneWay
 from thesis_readers.readers.BPIC12LogReader import BPIC12LogReader
@@ -21,34 +23,14 @@ FULL = 'FULL'
 symbol_mapping = {index: char for index, char in enumerate(set([chr(i) for i in range(1, 3000) if len(chr(i)) == 1]))}
 
 
-def results_by_instance_seq2seq(idx2vocab, start_id, end_id, test_dataset, model, mode='weighted'):
+def results_by_instance_seq2seq(idx2vocab, start_id, end_id, test_dataset, model, mode='weighted', metrics=None, decoding=DecodingModes.IDS, num_workers=None):
     print("Start results by instance evaluation")
     print(STEP1)
     X_test, y_test = test_dataset
     y_test = y_test.astype(int)
     print(STEP2)
-    eval_results = []
     y_pred = model.predict(X_test[0] if len(X_test) == 1 else X_test).argmax(axis=-1).astype(np.int32)
-    iterator = enumerate(zip(X_test[0], y_test, y_pred))
-    for idx, (row_x_test, row_y_test, row_y_pred) in tqdm(iterator, total=len(y_test)):
-        row_x_test = row_x_test.astype(np.int32)
-        first_word_test = np.max([np.argmin(row_y_test == 0), 1])
-        first_word_pred = np.max([np.argmin(row_y_pred == 0), 1])
-        first_word_x = np.argmin(row_x_test == 0)
-        longer_sequence_start = min([first_word_test, first_word_pred])
-        instance_result = {
-            "trace": idx,
-            f"full_{SEQUENCE_LENGTH}": len(row_y_test)-first_word_test,
-            f"input_x_{SEQUENCE_LENGTH}": len(row_x_test)-first_word_x,
-            f"true_y_{SEQUENCE_LENGTH}": len(row_y_test)-first_word_test,
-            f"pred_y_{SEQUENCE_LENGTH}": len(row_y_pred)-first_word_pred,
-        }
-        instance_result.update(compute_traditional_metrics(mode, row_y_test[longer_sequence_start:], row_y_pred[longer_sequence_start:]))
-        instance_result.update(compute_sequence_metrics(row_y_test[first_word_test:], row_y_pred[-first_word_pred:]))
-        instance_result.update(compute_decoding(idx2vocab, row_y_pred[first_word_pred:], row_y_test[first_word_test:], row_x_test[first_word_x:]))
-        eval_results.append(instance_result)
-
-    results = pd.DataFrame(eval_results)
+    results = evaluate_instances(idx2vocab, X_test[0], y_test, y_pred, mode, metrics=metrics, decoding=decoding, num_workers=num_workers)
     print(STEP3)
     print(results)
     return results
@@ -93,15 +75,6 @@ def results_by_instance(idx2vocab, start_id, end_id, test_dataset, model, save_p
         results.to_csv(save_path, index=None)
 
 
-def compute_traditional_metrics(mode, row_y_test_zeros, row_y_pred_zeros):
-    return {
-        "acc": accuracy_score(row_y_pred_zeros, row_y_test_zeros),
-        "recall": recall_score(row_y_pred_zeros, row_y_test_zeros, average=mode, zero_division=0),
-        "precision": precision_score(row_y_pred_zeros, row_y_test_zeros, average=mode, zero_division=0),
-        "f1": f1_score(row_y_pred_zeros, row_y_test_zeros, average=mode, zero_division=0),
-    }
-
-
 def compute_sequence_metrics(true_seq, pred_seq):
 
     true_seq_symbols = "".join([symbol_mapping[idx] for idx in true_seq])
@@ -120,18 +93,6 @@ def compute_sequence_metrics(true_seq, pred_seq):
     return dict_instance_distances
 
 
-def compute_decoding(idx2vocab, row_y_pred, row_y_test, row_x_test):
-    x_convert = [f"{i:03d}" for i in row_x_test]
-    return {
-        "input": " | ".join(["-".join(x_convert[:lim + 1]) for lim in range(len(x_convert))]),
-        "true_encoded": " -> ".join([f"{i:03d}" for i in row_y_test]),
-        "pred_encoded": " -> ".join([f"{i:03d}" for i in row_y_pred]),
-        "true_encoded_with_padding": " -> ".join([f"{i:03d}" for i in row_y_test]),
-        "pred_encoded_with_padding": " -> ".join([f"{i:03d}" for i in row_y_pred]),
-        "true_decoded": " -> ".join([idx2vocab[i] for i in row_y_test]),
-        "pred_decoded": " -> ".join([idx2vocab[i] for i in row_y_pred]),
-    }
-
 def compute_pred_seq(idx2vocab, row_y_pred, row_y_test, row_x_test, last_word_test, last_word_pred):
     x_convert = [f"{i:03d}" for i in row_x_test[:last_word_test]]
     if len(row_x_test[:last_word_test]) <= 1:
@@ -199,12 +160,13 @@ def results_by_len(idx2vocab, test_dataset, model, save_path=None, mode='weighte
         flat_y_pred = y_pred_argmax_indices.flatten()[non_zero_indices]
         labels_2_include = range(1, len(idx2vocab))
         # print(len(eval_results))
+        traditional_metrics = compute_traditional_metrics_batch(flat_y_test[None], flat_y_pred[None], mode=mode)
         eval_results[seq_len] = {
             NUMBER_OF_INSTANCES: len(y_pred),
-            "acc": accuracy_score(flat_y_test, flat_y_pred),
-            "precision": precision_score(flat_y_test, flat_y_pred, average=mode, zero_division=0),
-            "recall": recall_score(flat_y_test, flat_y_pred, average=mode, zero_division=0),
-            "f1": f1_score(flat_y_test, flat_y_pred, average=mode, zero_division=0),
+            "acc": traditional_metrics["acc"][0],
+            "precision": traditional_metrics["precision"][0],
+            "recall": traditional_metrics["recall"][0],
+            "f1": traditional_metrics["f1"][0],
             "dl_distance": damerau_levenshtein_score(y_test_argmax_indices[:, :seq_len], y_pred_argmax_indices[:, :seq_len]),
         }
 
@@ -219,9 +181,7 @@ def damerau_levenshtein_score(true_seq, pred_seq):
     if true_seq.ndim == 1 and pred_seq.ndim == 1:
         true_seq = [true_seq]
         pred_seq = [pred_seq]
-    true_seq_symbols = ["".join([symbol_mapping[idx] for idx in row]) for row in true_seq]
-    pred_seq_symbols = ["".join([symbol_mapping[idx] for idx in row]) for row in pred_seq]
-    all_distances = [textdistance.damerau_levenshtein.normalized_similarity(t_seq, p_seq) for t_seq, p_seq in zip(true_seq_symbols, pred_seq_symbols)]
+    all_distances = damerau_levenshtein(*pad_sequences(true_seq), *pad_sequences(pred_seq))
     return np.mean(all_distances)
 
 
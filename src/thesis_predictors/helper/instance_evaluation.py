@@ -0,0 +1,77 @@
+import json
+import multiprocessing as mp
+import pathlib
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+from tqdm import tqdm
+
+from thesis_predictors.evaluation.instance_metrics import ALL_METRICS, DecodingModes, _evaluate_chunk_star, _init_worker
+
+
+def compute_traditional_metrics(mode, row_y_test_zeros, row_y_pred_zeros, metrics: List[str] = None):
+    all_metrics = {
+        "acc": lambda: accuracy_score(row_y_pred_zeros, row_y_test_zeros),
+        "recall": lambda: recall_score(row_y_pred_zeros, row_y_test_zeros, average=mode, zero_division=0),
+        "precision": lambda: precision_score(row_y_pred_zeros, row_y_test_zeros, average=mode, zero_division=0),
+        "f1": lambda: f1_score(row_y_pred_zeros, row_y_test_zeros, average=mode, zero_division=0),
+    }
+    return {name: fn() for name, fn in all_metrics.items() if metrics is None or name in metrics}
+
+
+def save_results(results: pd.DataFrame, path: pathlib.Path, idx2vocab: Dict[int, str] = None) -> pathlib.Path:
+    # The id arrays become arrow list columns and the vocabulary travels along in the schema metadata
+    idx2vocab = idx2vocab or results.attrs.get("idx2vocab") or {}
+    table = pa.Table.from_pandas(results, preserve_index=False)
+    metadata = dict(table.schema.metadata or {}, idx2vocab=json.dumps({int(idx): word for idx, word in idx2vocab.items()}))
+    pq.write_table(table.replace_schema_metadata(metadata), path)
+    return path
+
+
+def load_results(path: pathlib.Path) -> pd.DataFrame:
+    table = pq.read_table(path)
+    results = table.to_pandas()
+    idx2vocab = (table.schema.metadata or {}).get(b"idx2vocab")
+    if idx2vocab:
+        results.attrs["idx2vocab"] = {int(idx): word for idx, word in json.loads(idx2vocab).items()}
+    return results
+
+
+def evaluate_instances(
+    idx2vocab: Dict[int, str],
+    x_test: np.ndarray,
+    y_test: np.ndarray,
+    y_pred: np.ndarray,
+    mode: str = 'weighted',
+    metrics: List[str] = None,
+    decoding: DecodingModes = DecodingModes.IDS,
+    num_workers: int = None,
+    chunk_size: int = 1000,
+) -> pd.DataFrame:
+    """Computes the per instance evaluation of results_by_instance_seq2seq on chunks of the test set.
+
+    metrics selects a subset of ALL_METRICS and decoding whether the input and output sequences are kept as id arrays, strings or not at all.
+    By default everything runs vectorized in the current process. Only an explicit num_workers > 1 spreads the chunks over a process pool,
+    whose workers import thesis_predictors.evaluation and not tensorflow.
+    """
+    unknown_metrics = set(metrics or []) - set(ALL_METRICS)
+    assert not unknown_metrics, f"Unknown metrics {unknown_metrics}. Choose from {ALL_METRICS}"
+    x_test, y_test, y_pred = np.asarray(x_test).astype(np.int32), np.asarray(y_test).astype(np.int32), np.asarray(y_pred).astype(np.int32)
+    chunks = [(x_test[start:start + chunk_size], y_test[start:start + chunk_size], y_pred[start:start + chunk_size], start) for start in range(0, len(y_test), chunk_size)]
+    num_workers = min(num_workers or 1, len(chunks))
+
+    if num_workers <= 1:
+        _init_worker(idx2vocab, mode, metrics, decoding)
+        partial_results = [_evaluate_chunk_star(chunk) for chunk in tqdm(chunks)]
+    else:
+        # Spawned like the bulk preprocessing, so the workers never fork a running tensorflow
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(processes=num_workers, initializer=_init_worker, initargs=(idx2vocab, mode, metrics, decoding)) as pool:
+            partial_results = list(tqdm(pool.imap(_evaluate_chunk_star, chunks), total=len(chunks)))
+    results = pd.concat(partial_results, ignore_index=True) if partial_results else pd.DataFrame()
+    results.attrs["idx2vocab"] = idx2vocab
+    return results
@@ -0,0 +1,75 @@
+import pathlib
+from typing import Dict, List
+
+import pandas as pd
+
+from ..helper.instance_evaluation import load_results, save_results
+
+# Hive style partitions, e.g. results/aggregates/dataset=DomesticDeclarationsLogReader/prefix=full/model=simple_lstm_model_one_way/part-0.parquet
+INSTANCES = "instances"
+AGGREGATES = "aggregates"
+PARTITION_KEYS = ["dataset", "prefix", "model"]
+AGGREGATE_BY = "input_x_seq_len"
+AGGREGATIONS = ["mean", "std", "median", "count"]
+PART_FILE = "part-0.parquet"
+
+
+def _partition_path(root: pathlib.Path, kind: str, dataset: str, prefix: str, model: str) -> pathlib.Path:
+    return pathlib.Path(root) / kind / f"dataset={dataset}" / f"prefix={prefix}" / f"model={model}"
+
+
+def compute_aggregates(results: pd.DataFrame, by: str = AGGREGATE_BY) -> pd.DataFrame:
+    # Long format with one row per (by, metric), so that metrics can be filtered while reading
+    metric_cols = [col for col in results.select_dtypes("number").columns if col not in ["trace", by]]
+    aggregates = results.groupby(by)[metric_cols].agg(AGGREGATIONS)
+    return aggregates.stack(level=0).rename_axis([by, "metric"]).reset_index()
+
+
+def save_to_result_store(results: pd.DataFrame, model: str, prefix: str, dataset: str, root: pathlib.Path = "results", idx2vocab: Dict[int, str] = None):
+    instance_folder = _partition_path(root, INSTANCES, dataset, prefix, model)
+    aggregate_folder = _partition_path(root, AGGREGATES, dataset, prefix, model)
+    instance_folder.mkdir(parents=True, exist_ok=True)
+    aggregate_folder.mkdir(parents=True, exist_ok=True)
+    save_results(results, instance_folder / PART_FILE, idx2vocab)
+    compute_aggregates(results).to_parquet(aggregate_folder / PART_FILE, index=False)
+    return instance_folder
+
+
+def import_csv_results(csv_path: pathlib.Path, dataset: str, root: pathlib.Path = "results", model: str = None, prefix: str = None):
+    """Imports a CSV written by Runner.evaluate before the result store. Those are named {prefix}_{label}.csv and do not record the dataset."""
+    csv_path = pathlib.Path(csv_path)
+    file_prefix, _, file_model = csv_path.stem.partition("_")
+    results = pd.read_csv(csv_path, index_col=0)
+    model, prefix = model or file_model, prefix or file_prefix
+    return save_to_result_store(results, model, prefix, dataset, root)
+
+
+def _read_partitioned(root: pathlib.Path, kind: str, filters: List[tuple]) -> pd.DataFrame:
+    folder = pathlib.Path(root) / kind
+    if not folder.exists():
+        return pd.DataFrame()
+    df = pd.read_parquet(folder, filters=filters or None)
+    # Partition columns come back as categoricals over all partitions, not just the selected ones
+    for key in PARTITION_KEYS:
+        df[key] = df[key].astype(str)
+    return df
+
+
+def _partition_filters(dataset: str = None, prefix: str = None, model: str = None, **column_filters) -> List[tuple]:
+    all_filters = dict(dataset=dataset, prefix=prefix, model=model, **column_filters)
+    return [(key, "in", [val] if isinstance(val, str) else list(val)) for key, val in all_filters.items() if val is not None]
+
+
+def load_aggregates(root: pathlib.Path = "results", dataset: str = None, prefix: str = None, model: str = None, metrics: List[str] = None) -> pd.DataFrame:
+    """Loads the precomputed aggregates of every stored evaluation that matches the filters. Each filter takes a single value or a list of values."""
+    return _read_partitioned(root, AGGREGATES, _partition_filters(dataset, prefix, model, metric=metrics))
+
+
+def load_instances(model: str, prefix: str, dataset: str, root: pathlib.Path = "results") -> pd.DataFrame:
+    return load_results(_partition_path(root, INSTANCES, dataset, prefix, model) / PART_FILE)
+
+
+def list_result_store(root: pathlib.Path = "results") -> pd.DataFrame:
+    folder = pathlib.Path(root) / AGGREGATES
+    partitions = [dict(part.split("=", 1) for part in path.parent.relative_to(folder).parts) for path in folder.glob(f"*/*/*/{PART_FILE}")]
+    return pd.DataFrame(partitions, columns=PARTITION_KEYS)
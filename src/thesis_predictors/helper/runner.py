@@ -1,4 +1,5 @@
 import io
+import time
 from tensorflow.python.keras.engine.training import Model
 import tqdm
 import json
@@ -7,6 +8,8 @@ import pathlib
 from thesis_readers import AbstractProcessLogReader
 from thesis_readers.readers.AbstractProcessLogReader import DatasetModes, FeatureModes
 from ..helper.evaluation import FULL, results_by_instance, results_by_instance_seq2seq, results_by_len, show_predicted_seq
+from thesis_predictors.evaluation.instance_metrics import DecodingModes
+from ..helper.result_store import save_to_result_store
 from .metrics import SparseAccuracyMetric, SparseCrossEntropyLoss
 
 
@@ -24,10 +27,15 @@ class Runner(object):
             num_val: int = None,
             num_test: int = None,
             ft_mode: FeatureModes = FeatureModes.EVENT_ONLY,
+            pipeline_options: dict = None,
     ):
         self.reader = reader
         self.model = model
-        self.train_dataset = self.reader.get_dataset(batch_size, DatasetModes.TRAIN, ft_mode)
+        self.ft_mode = ft_mode
+        self.statistics = {}
+        # Only the training split gets shuffled or sharded, see AbstractProcessLogReader.build_pipeline
+        pipeline_options = pipeline_options or {}
+        self.train_dataset = self.reader.get_dataset(batch_size, DatasetModes.TRAIN, ft_mode, **pipeline_options)
         self.val_dataset = self.reader.get_dataset(batch_size, DatasetModes.VAL, ft_mode)
         self.test_dataset = self.reader.get_dataset(1, DatasetModes.TEST, ft_mode)
         if num_train:
@@ -35,8 +43,10 @@ class Runner(object):
         if num_val:
             self.val_dataset = self.val_dataset.take(num_val)
         if num_test:
-            self.test_dataset = self.test_dataset.take(num_val)
-        self.test_dataset_full = self.reader.gather_full_dataset(self.test_dataset)
+            self.test_dataset = self.test_dataset.take(num_test)
+        start_time = time.time()
+        self.test_dataset_full = self.reader.get_split_arrays(DatasetModes.TEST, ft_mode, num_test)
+        self.statistics["gather_test_data_seconds"] = time.time() - start_time
 
         self.epochs = epochs
         self.batch_size = batch_size
@@ -72,17 +82,33 @@ class Runner(object):
         #         "val_loss" : val_loss,
         #         "val_acc" : val_acc,
         #     })
+        start_time = time.time()
         self.history = self.model.fit(train_dataset, validation_data=val_dataset, epochs=self.epochs)
+        self.statistics["train_seconds"] = time.time() - start_time
+        # Comparable with benchmark_input_pipeline. The time includes validation, so this is a lower bound.
+        num_train_examples = self.history.params["steps"] * self.batch_size if self.history.params.get("steps") else len(self.reader.trace_train)
+        self.statistics["train_examples_per_sec"] = num_train_examples * self.epochs / self.statistics["train_seconds"]
 
         return self
 
-    def evaluate(self, save_path="results", prefix="full", label=None, test_dataset_full=None, dont_save=False):
+    def evaluate(self, save_path="results", prefix="full", label=None, test_dataset_full=None, dont_save=False, metrics=None, decoding=DecodingModes.IDS, num_workers=None):
         test_dataset = test_dataset_full or self.test_dataset_full
-        self.results = results_by_instance_seq2seq(self.reader.idx2vocab, self.start_id, self.end_id, test_dataset, self.model)
+        start_time = time.time()
+        self.results = results_by_instance_seq2seq(
+            self.reader.idx2vocab,
+            self.start_id,
+            self.end_id,
+            test_dataset,
+            self.model,
+            metrics=metrics,
+            decoding=decoding,
+            num_workers=num_workers,
+        )
+        self.statistics["evaluate_seconds"] = time.time() - start_time
         if not dont_save:
             label = label or self.label
             save_path = save_path or self.save_path
-            self.results.to_csv(pathlib.Path(save_path) / (f"{prefix}_{label}.csv"))
+            save_to_result_store(self.results, label, prefix, type(self.reader).__name__, save_path, self.reader.idx2vocab)
         return self
 
     def save_model(self, save_path="build", prefix="full", label=None):
@@ -100,5 +126,7 @@ class Runner(object):
         history = {
             "history": tmp_history,
             "params": self.history.params,
+            # Lets the model registry feed the inputs the model was trained on
+            "ft_mode": self.ft_mode.name,
         }
         return history
\ No newline at end of file
@@ -32,8 +32,8 @@ class FullLSTMModelOneWay(Model):
         return y_pred
 
     def summary(self):
-        events = Input(shape=(self.max_len,))
-        features = Input(shape=(self.max_len, self.feature_len))
+        events = Input(shape=(None,))
+        features = Input(shape=(None, self.feature_len))
         x = [events, features]
         model = Model(inputs=[x], outputs=self.call(x))
         return model.summary()
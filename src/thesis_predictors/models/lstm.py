@@ -32,7 +32,7 @@ class SimpleLSTMModelOneWay(Model):
         return y_pred
 
     def summary(self):
-        x = Input(shape=(self.max_len,))
+        x = Input(shape=(None,))
         model = Model(inputs=[x], outputs=self.call(x))
         return model.summary()
 
@@ -33,7 +33,8 @@ class TransformerModelOneWay(Model):
         return y_pred
 
     def summary(self):
-        x = Input(shape=(self.max_len,))
+        # The sequence length is left open, so length bucketed batches can be fed as well
+        x = Input(shape=(None,))
         model = Model(inputs=[x], outputs=self.call(x))
         return model.summary()
 
@@ -105,14 +106,16 @@ class TransformerBlock(layers.Layer):
 class TokenAndPositionEmbedding(layers.Layer):
     def __init__(self, maxlen, vocab_size, embed_dim):
         super(TokenAndPositionEmbedding, self).__init__()
+        self.maxlen = maxlen
         self.token_emb = layers.Embedding(input_dim=vocab_size, output_dim=embed_dim, mask_zero=0)
         self.pos_emb = layers.Embedding(input_dim=maxlen, output_dim=embed_dim, mask_zero=0)
         self.zero = tf.constant(0, dtype=tf.float32)
         self.multiply = Multiply()
 
     def call(self, x):
-        maxlen = tf.shape(x)[-1]
-        positions = tf.range(start=0, limit=maxlen, delta=1, dtype=tf.float32)
+        seq_len = tf.shape(x)[-1]
+        # Sequences are right aligned, hence positions count back from maxlen. A sequence cropped to a shorter bucket keeps its position embeddings.
+        positions = tf.range(start=self.maxlen - seq_len, limit=self.maxlen, delta=1, dtype=tf.float32)
         # zero_indices = tf.cast(tf.not_equal(x, self.zero), tf.float32)
         # positions = self.multiply([positions, zero_indices])
         positions = self.pos_emb(tf.cast(positions, tf.int32))
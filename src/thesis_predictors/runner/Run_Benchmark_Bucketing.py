@@ -0,0 +1,46 @@
+import time
+import pandas as pd
+from tensorflow.keras.optimizers import Adam
+from ..helper.metrics import SparseAccuracyMetric, SparseCrossEntropyLoss
+from ..models.direct_data_lstm import FullLSTMModelOneWay
+from ..models.lstm import SimpleLSTMModelOneWay
+from ..models.transformer import TransformerModelOneWay
+from thesis_readers.readers.AbstractProcessLogReader import AbstractProcessLogReader, DatasetModes, FeatureModes, TaskModes
+from thesis_readers import DomesticDeclarationsLogReader
+
+
+def benchmark_training(reader: AbstractProcessLogReader, model_fn, ft_mode: FeatureModes, batch_size: int = 64, epochs: int = 2, bucketed: bool = False, num_buckets: int = 5):
+    dataset = reader.get_dataset(batch_size, DatasetModes.TRAIN, ft_mode, bucketed=bucketed, num_buckets=num_buckets)
+    model = model_fn()
+    model.compile(loss=SparseCrossEntropyLoss(), optimizer=Adam(0.001), metrics=[SparseAccuracyMetric()])
+    # The first epoch traces the model once per bucket shape and is not timed
+    model.fit(dataset, epochs=1, verbose=0)
+    start_time = time.perf_counter()
+    history = model.fit(dataset, epochs=epochs, verbose=0)
+    duration = time.perf_counter() - start_time
+    num_examples = len(reader.trace_train) * epochs
+    return {
+        "model": model.name,
+        "bucketed": bucketed,
+        "num_buckets": num_buckets if bucketed else 1,
+        "seconds": duration,
+        "examples_per_sec": num_examples / duration,
+        "loss": history.history["loss"][-1],
+    }
+
+
+if __name__ == "__main__":
+    reader = DomesticDeclarationsLogReader(debug=False, mode=TaskModes.NEXT_EVENT_EXTENSIVE)
+    reader = reader.init_data()
+    print(f"Bucket boundaries: {reader.get_bucket_boundaries()} for max_len {reader.max_len}")
+    all_models = [
+        (lambda: FullLSTMModelOneWay(reader.vocab_len, reader.max_len, reader.feature_len - 1), FeatureModes.FULL_SEP),
+        (lambda: SimpleLSTMModelOneWay(reader.vocab_len, reader.max_len), FeatureModes.EVENT_ONLY),
+        (lambda: TransformerModelOneWay(reader.vocab_len, reader.max_len), FeatureModes.EVENT_ONLY),
+    ]
+    results = []
+    for model_fn, ft_mode in all_models:
+        for bucketed in [False, True]:
+            results.append(benchmark_training(reader, model_fn, ft_mode, bucketed=bucketed))
+            print(results[-1])
+    print(pd.DataFrame(results))
@@ -0,0 +1,174 @@
+import time
+import pathlib
+import tempfile
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from pm4py.objects.log.util import dataframe_utils
+from thesis_readers.readers.AbstractProcessLogReader import AbstractProcessLogReader, DatasetModes, FeatureModes, TaskModes
+from thesis_readers.misc.storage import StorageFormats, load_event_frame, save_event_frame
+
+
+def time_it(fn: Callable, *args, repeats: int = 3, **kwargs):
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings.append(time.perf_counter() - start_time)
+    return result, min(timings)
+
+
+def benchmark_tensorization(reader: AbstractProcessLogReader, repeats: int = 3):
+    def tensorize_per_trace():
+        # Includes building the per-case DataFrames, which the vectorized path does not need
+        reader._trace_dict = None
+        return reader._tensorize_traces_per_trace()
+
+    container_per_trace, time_per_trace = time_it(tensorize_per_trace, repeats=1)
+    container_vectorized, time_vectorized = time_it(reader._tensorize_traces, repeats=repeats)
+    return {
+        "class_name": type(reader).__name__,
+        "log_len": reader.log_len,
+        "max_len": reader.max_len,
+        "feature_len": reader.feature_len,
+        "per_trace": time_per_trace,
+        "vectorized": time_vectorized,
+        "speedup": time_per_trace / time_vectorized,
+        "is_equal": np.array_equal(container_per_trace, container_vectorized),
+    }
+
+
+def benchmark_input_pipeline(reader: AbstractProcessLogReader, batch_size: int = 64, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY, pipeline_configs: dict = None, epochs: int = 2, num_batches: int = None):
+    # Compare the examples/sec with the training throughput of Runner.statistics to see whether training is input bound
+    pipeline_configs = pipeline_configs or {
+        "default": {},
+        "no_prefetch": dict(prefetch=None),
+        "sequential_map": dict(num_parallel_calls=None, prefetch=None),
+        "shuffled": dict(shuffle_buffer=10000),
+        "non_deterministic": dict(shuffle_buffer=10000, deterministic=False),
+        "memory_cache": dict(shuffle_buffer=10000, cache_path=""),
+    }
+    results = []
+    for name, pipeline_options in pipeline_configs.items():
+        dataset = reader.get_dataset(batch_size, DatasetModes.TRAIN, ft_mode, **pipeline_options)
+        for epoch in range(epochs):
+            results.append({
+                "class_name": type(reader).__name__,
+                "ft_mode": FeatureModes(ft_mode).name,
+                "pipeline": name,
+                "epoch": epoch,
+                **benchmark_dataset(dataset, num_batches),
+            })
+    return results
+
+
+def benchmark_container_memory(reader: AbstractProcessLogReader):
+    dense_mb = reader.log_len * reader.max_len * reader.feature_len * np.dtype(np.float64).itemsize / 2**20
+    compact_mb = reader.data_container.nbytes / 2**20
+    return {
+        "class_name": type(reader).__name__,
+        "num_binary_features": len(reader.idx_binary_features),
+        "num_continuous_features": len(reader.idx_continuous_features),
+        "dense_float64_mb": dense_mb,
+        "compact_mb": compact_mb,
+        "reduction": dense_mb / compact_mb,
+    }
+
+
+def benchmark_dataset(dataset: tf.data.Dataset, num_batches: int = None):
+    dataset = dataset.take(num_batches) if num_batches else dataset
+    num_examples = 0
+    start_time = time.perf_counter()
+    for _, targets in dataset:
+        num_examples += len(targets)
+    duration = time.perf_counter() - start_time
+    return {"num_examples": num_examples, "seconds": duration, "examples_per_sec": num_examples / duration}
+
+
+def benchmark_one_hot(reader: AbstractProcessLogReader, batch_size: int = 64, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY_ONEHOT, num_batches: int = None):
+    def build_materialized():
+        features, targets = reader._generate_examples(DatasetModes.TRAIN, ft_mode)
+        return tf.data.Dataset.from_tensor_slices((features, targets)).batch(batch_size), features
+
+    (materialized_dataset, materialized_features), materialized_time = time_it(build_materialized, repeats=1)
+    on_device_dataset, on_device_time = time_it(reader.get_dataset, batch_size, DatasetModes.TRAIN, ft_mode, repeats=1)
+    fields = reader._get_required_fields(ft_mode)
+    return {
+        "class_name": type(reader).__name__,
+        "ft_mode": FeatureModes(ft_mode).name,
+        "vocab_len": reader.vocab_len,
+        "materialized_mb": np.asarray(materialized_features).nbytes / 2**20,
+        "on_device_mb": sum(reader.trace_train[field].nbytes for field in fields) / 2**20,
+        "materialized_build_sec": materialized_time,
+        "on_device_build_sec": on_device_time,
+        "materialized_examples_per_sec": benchmark_dataset(materialized_dataset, num_batches)["examples_per_sec"],
+        "on_device_examples_per_sec": benchmark_dataset(on_device_dataset, num_batches)["examples_per_sec"],
+    }
+
+
+def benchmark_lazy_prefixes(reader: AbstractProcessLogReader, batch_size: int = 64, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY, num_batches: int = None):
+    assert reader.mode == TaskModes.NEXT_EVENT_LAZY, f"Reader has to be in {TaskModes.NEXT_EVENT_LAZY} mode"
+    prefix_index, targets = reader._get_split(DatasetModes.TRAIN)
+    materialized_prefixes = reader._get_prefix_windows(reader.data_container)[prefix_index[:, 0], prefix_index[:, 1]]
+    materialized_dataset = tf.data.Dataset.from_tensor_slices(reader._prepare_input_data(materialized_prefixes, targets, ft_mode)).batch(batch_size)
+    lazy_dataset = reader.get_dataset(batch_size, DatasetModes.TRAIN, ft_mode)
+    return {
+        "class_name": type(reader).__name__,
+        "ft_mode": FeatureModes(ft_mode).name,
+        "materialized_mb": (materialized_prefixes.nbytes + targets.nbytes) / 2**20,
+        "lazy_mb": (reader.data_container.nbytes + prefix_index.nbytes + targets.nbytes) / 2**20,
+        "materialized_examples_per_sec": benchmark_dataset(materialized_dataset, num_batches)["examples_per_sec"],
+        "lazy_examples_per_sec": benchmark_dataset(lazy_dataset, num_batches)["examples_per_sec"],
+    }
+
+
+def benchmark_storage_formats(reader: AbstractProcessLogReader, repeats: int = 3):
+    source = load_event_frame(reader.csv_path, StorageFormats.CSV)
+    categorical_cols = [reader.col_case_id, reader.col_activity_id]
+    results = {"class_name": type(reader).__name__, "num_rows": len(source)}
+
+    def load(path, storage_format):
+        df = load_event_frame(path, storage_format)
+        return dataframe_utils.convert_timestamp_columns_in_df(df, timest_columns=[reader.col_timestamp])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for storage_format in StorageFormats:
+            path = pathlib.Path(tmp_dir) / f"{type(reader).__name__}{storage_format.value}"
+            save_event_frame(source, path, storage_format, categorical_cols)
+            df, load_time = time_it(load, path, storage_format, repeats=repeats)
+            results[f"{storage_format.name.lower()}_load_sec"] = load_time
+            results[f"{storage_format.name.lower()}_memory_mb"] = df.memory_usage(deep=True).sum() / 2**20
+            results[f"{storage_format.name.lower()}_file_mb"] = path.stat().st_size / 2**20
+    return results
+
+
+def run_benchmark(benchmark: Callable, readers: list, with_init_data: bool = True, **kwargs):
+    results = []
+    for reader in readers:
+        print(f"==================== {type(reader).__name__} ===================")
+        reader = reader.init_data() if with_init_data and reader.data is None else reader
+        result = benchmark(reader, **kwargs)
+        results.extend(result if isinstance(result, list) else [result])
+        print(result)
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    from thesis_readers import BPIC12LogReader, DomesticDeclarationsLogReader, HospitalLogReader, PermitLogReader, RabobankTicketsLogReader, RequestForPaymentLogReader, VolvoIncidentsReader
+    all_readers = [
+        BPIC12LogReader(),
+        DomesticDeclarationsLogReader(),
+        PermitLogReader(),
+        RabobankTicketsLogReader(),
+        RequestForPaymentLogReader(),
+        VolvoIncidentsReader(),
+        HospitalLogReader(),
+    ]
+    print(run_benchmark(benchmark_storage_formats, all_readers, with_init_data=False))
+    print(run_benchmark(benchmark_tensorization, all_readers))
+    print(run_benchmark(benchmark_container_memory, all_readers))
+    print(run_benchmark(benchmark_one_hot, all_readers, ft_mode=FeatureModes.FULL))
+    print(run_benchmark(benchmark_input_pipeline, all_readers, ft_mode=FeatureModes.FULL))
@@ -0,0 +1,165 @@
+import _thread
+import contextlib
+import math
+import threading
+import time
+import traceback
+import multiprocessing as mp
+import signal
+from typing import List, Tuple, Type
+
+import pandas as pd
+import jsonlines
+
+from thesis_readers.readers.AbstractProcessLogReader import AbstractProcessLogReader
+from thesis_readers.misc.helper import test_reader
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class CpuTimeExceeded(Exception):
+    pass
+
+
+def _raise_cpu_time_exceeded(signum, frame):
+    raise CpuTimeExceeded("CPU time limit exceeded")
+
+
+def _set_resource_limits(cpu_time_limit_sec: int = None):
+    if resource is None:
+        print("Resource limits are not supported on this platform")
+        return
+    if cpu_time_limit_sec:
+        # The kernel sends SIGXCPU at the soft limit, which kills the worker unless it is handled. The pool never reports a dead worker and would wait forever.
+        signal.signal(signal.SIGXCPU, _raise_cpu_time_exceeded)
+        # RLIMIT_CPU counts from the start of the process, so the time spent on the imports of the worker is added
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft_limit = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_time_limit_sec
+        resource.setrlimit(resource.RLIMIT_CPU, (soft_limit, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+
+
+def _lift_resource_limits():
+    # SIGXCPU repeats every second past the soft limit, so it has to stop before the results are collected
+    signal.signal(signal.SIGXCPU, signal.SIG_IGN)
+    hard_limit = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    resource.setrlimit(resource.RLIMIT_CPU, (hard_limit, hard_limit))
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+class MemoryWatchdog():
+    """Interrupts the main thread once the peak resident memory of the process exceeds limit_mb.
+
+    RLIMIT_AS would cap the virtual address space instead, which tensorflow, pm4py and numpy reserve far beyond the memory they use.
+    The interrupt only lands between python bytecodes, so a long running C call can overshoot the limit until it returns.
+    """
+    def __init__(self, limit_mb: int, interval_sec: float = 0.5):
+        self.limit_mb = limit_mb
+        self.interval_sec = interval_sec
+        self.exceeded = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval_sec):
+            if _peak_rss_mb() > self.limit_mb:
+                self.exceeded = True
+                _thread.interrupt_main()
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        # Joining makes sure that a pending interrupt is raised inside the with block and not somewhere after it
+        self._stopped.set()
+        self._thread.join()
+
+
+def preprocess_reader(job: Tuple[Type[AbstractProcessLogReader], dict, dict], memory_limit_mb: int = None, cpu_time_limit_sec: int = None) -> dict:
+    """Runs test_reader on one job. memory_limit_mb caps the peak resident memory of the process and cpu_time_limit_sec the cpu time of the job."""
+    reader_cls, reader_kwargs, test_kwargs = job
+    _set_resource_limits(cpu_time_limit_sec)
+    watchdog = MemoryWatchdog(memory_limit_mb) if memory_limit_mb and resource is not None else None
+    start_time = time.time()
+    try:
+        with watchdog or contextlib.nullcontext():
+            stats = test_reader(reader_cls(**reader_kwargs), **test_kwargs)
+        error = None
+    except KeyboardInterrupt:
+        if watchdog is None or not watchdog.exceeded:
+            raise
+        stats = {"class_name": reader_cls.__name__}
+        error = None
+    except Exception as e:
+        stats = {"class_name": reader_cls.__name__}
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+    finally:
+        if cpu_time_limit_sec and resource is not None:
+            _lift_resource_limits()
+    # Jobs that finish between two checks of the watchdog are caught here
+    if watchdog is not None and (watchdog.exceeded or _peak_rss_mb() > memory_limit_mb):
+        error = error or f"MemoryError: Peak resident memory exceeded {memory_limit_mb} MB"
+    stats["bulk"] = {
+        "wall_time": time.time() - start_time,
+        "peak_rss_mb": _peak_rss_mb(),
+        "error": error,
+    }
+    print(f"Finished {reader_cls.__name__} in {stats['bulk']['wall_time']:.2f} seconds" + (f" with {error}" if error else ""))
+    return stats
+
+
+def _preprocess_reader_star(args):
+    return preprocess_reader(*args)
+
+
+def run_bulk_preprocessing(
+    jobs: List[Tuple[Type[AbstractProcessLogReader], dict, dict]],
+    num_workers: int = None,
+    memory_limit_mb: int = None,
+    cpu_time_limit_sec: int = None,
+    save_path_jsonl: str = 'statst.jsonl',
+    save_path_csv: str = 'statst.csv',
+):
+    # Every job gets a fresh spawned process, so limits and peak RSS are per reader and tensorflow is never forked
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(processes=num_workers, maxtasksperchild=1) as pool:
+        stats_collector = pool.map(_preprocess_reader_star, [(job, memory_limit_mb, cpu_time_limit_sec) for job in jobs], chunksize=1)
+
+    if save_path_jsonl:
+        jsonlines.open(save_path_jsonl, mode='w').write_all(stats_collector)
+    if save_path_csv:
+        pd.json_normalize([dict(jl, column_stats=None) for jl in stats_collector]).to_csv(save_path_csv)
+    print(pd.DataFrame([dict(class_name=stats["class_name"], **stats["bulk"]) for stats in stats_collector]))
+    return stats_collector
+
+
+def default_jobs(**job_kwargs) -> List[Tuple[Type[AbstractProcessLogReader], dict, dict]]:
+    from thesis_readers import BPIC12LogReader, DomesticDeclarationsLogReader, HospitalLogReader, PermitLogReader, RabobankTicketsLogReader, RequestForPaymentLogReader, VolvoIncidentsReader
+    job_kwargs = dict(dict(recompute_log=True, save_viz=True), **job_kwargs)
+    return [
+        (BPIC12LogReader, {}, job_kwargs),
+        (DomesticDeclarationsLogReader, {}, job_kwargs),
+        (PermitLogReader, {}, job_kwargs),
+        (RabobankTicketsLogReader, {}, job_kwargs),
+        (RequestForPaymentLogReader, {}, job_kwargs),
+        (VolvoIncidentsReader, {}, job_kwargs),
+        (HospitalLogReader, {}, dict(job_kwargs, with_viz_procmap=False)),
+    ]
+
+
+def main(num_workers: int = 4, memory_limit_mb: int = 16000, cpu_time_limit_sec: int = None, save_path_jsonl: str = 'statst.jsonl', save_path_csv: str = 'statst.csv'):
+    return run_bulk_preprocessing(default_jobs(), num_workers, memory_limit_mb, cpu_time_limit_sec, save_path_jsonl, save_path_csv)
+
+
+if __name__ == '__main__':
+    main()
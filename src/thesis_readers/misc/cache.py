@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import pathlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from thesis_readers.misc.constants import DATA_FOLDER_CACHE
+
+
+class DatasetCache():
+    """On-disk cache of a fully preprocessed reader.
+
+    Every array is stored as its own .npy file so it can be memory-mapped on load.
+    Everything else (vocab, fitted preprocessors, shapes, ...) goes into a pickle.
+    """
+    meta_file = "meta.pkl"
+    frame_file = "data.pkl"
+    config_file = "config.json"
+
+    def __init__(self, name: str, config: dict, folder: pathlib.Path = DATA_FOLDER_CACHE) -> None:
+        self.name = name
+        self.config = config
+        self.folder = pathlib.Path(folder)
+        self.key = self.compute_key(config)
+        self.path = self.folder / f"{self.name}_{self.key}"
+
+    @staticmethod
+    def compute_key(config: dict) -> str:
+        serialized = json.dumps(config, sort_keys=True, default=str)
+        return hashlib.sha1(serialized.encode('utf-8')).hexdigest()[:16]
+
+    def exists(self) -> bool:
+        return (self.path / self.meta_file).exists()
+
+    def save(self, arrays: Dict[str, np.ndarray], meta: dict, frame=None) -> pathlib.Path:
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+        for name, arr in arrays.items():
+            np.save(tmp_path / f"{name}.npy", np.asarray(arr), allow_pickle=False)
+        if frame is not None:
+            frame.to_pickle(tmp_path / self.frame_file)
+        json.dump(self.config, open(tmp_path / self.config_file, 'w'), sort_keys=True, default=str)
+        # Meta is written last and doubles as the marker of a complete entry
+        meta = dict(meta, _config=self.config, _arrays=list(arrays.keys()))
+        pickle.dump(meta, open(tmp_path / self.meta_file, 'wb'))
+        self.clear()
+        os.replace(tmp_path, self.path)
+        return self.path
+
+    def load(self, mmap_mode: str = 'r') -> Tuple[Dict[str, np.ndarray], dict, object]:
+        meta = pickle.load(open(self.path / self.meta_file, 'rb'))
+        arrays = {name: np.load(self.path / f"{name}.npy", mmap_mode=mmap_mode) for name in meta["_arrays"]}
+        frame_path = self.path / self.frame_file
+        frame = pd.read_pickle(frame_path) if frame_path.exists() else None
+        return arrays, meta, frame
+
+    def clear(self) -> bool:
+        if not self.path.exists():
+            return False
+        shutil.rmtree(self.path)
+        return True
+
+    def prune(self, match_keys: List[str]) -> int:
+        """Removes the other entries of this name whose config agrees with this one on match_keys. Those are superseded by this entry."""
+        config = json.loads(json.dumps(self.config, default=str))
+        num_removed = 0
+        for entry in self.folder.glob(f"{self.name}_*"):
+            config_path = entry / self.config_file
+            if entry == self.path or not config_path.exists():
+                continue
+            other_config = json.load(open(config_path))
+            if all(other_config.get(key) == config.get(key) for key in match_keys):
+                shutil.rmtree(entry)
+                num_removed += 1
+        return num_removed
+
+    def clear_all(self) -> int:
+        if not self.folder.exists():
+            return 0
+        entries = [entry for entry in self.folder.glob(f"{self.name}_*") if entry.is_dir()]
+        for entry in entries:
+            shutil.rmtree(entry)
+        return len(entries)
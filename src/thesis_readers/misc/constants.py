@@ -6,10 +6,12 @@ DATA_FOLDER = importlib_resources.files(__package__).parent / "data"
 #  pathlib.Path(__file__).parent.parent / "data"
 DATA_FOLDER_PREPROCESSED = DATA_FOLDER / "preprocessed"
 DATA_FOLDER_VISUALIZATION = DATA_FOLDER / "graphs"
+DATA_FOLDER_CACHE = DATA_FOLDER_PREPROCESSED / "cache"
 
 print("================= Folder =====================")
 print(f"Data Folder: {DATA_FOLDER}")
 print(f"Preprocessed Data Folder: {DATA_FOLDER_PREPROCESSED}")
 print(f"Process Graphs Folder: {DATA_FOLDER_VISUALIZATION}")
+print(f"Dataset Cache Folder: {DATA_FOLDER_CACHE}")
 print("==============================================")
 # print(importlib_resources.files(__package__).parent / "data")
@@ -9,9 +9,10 @@ def test_reader(
         with_viz_dfg: bool = True,
         save_preprocessed: bool = True,
         save_viz = False,
+        streaming: bool = False,
 ):
     if recompute_log:
-        reader = reader.init_log(save_preprocessed)
+        reader = reader.init_log(save_preprocessed, streaming=streaming)
     reader = reader.init_data()
     ds_counter = reader.get_dataset()
     example = next(iter(ds_counter.batch(10)))
@@ -0,0 +1,39 @@
+import pathlib
+from enum import Enum
+from typing import List
+
+import pandas as pd
+
+
+class StorageFormats(Enum):
+    CSV = ".csv"
+    PARQUET = ".parquet"
+    FEATHER = ".feather"
+
+
+def save_event_frame(df: pd.DataFrame, path: pathlib.Path, storage_format: StorageFormats = StorageFormats.CSV, categorical_cols: List[str] = None):
+    if storage_format == StorageFormats.CSV:
+        df.to_csv(path, index=False)
+        return path
+
+    df = df.reset_index(drop=True)
+    for col in df.select_dtypes('object').columns:
+        # Arrow cannot store object columns that mix value types
+        if pd.api.types.infer_dtype(df[col], skipna=True).startswith("mixed"):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    for col in (categorical_cols or []):
+        df[col] = df[col].astype('category')
+
+    if storage_format == StorageFormats.PARQUET:
+        df.to_parquet(path, index=False)
+    if storage_format == StorageFormats.FEATHER:
+        df.to_feather(path)
+    return path
+
+
+def load_event_frame(path: pathlib.Path, storage_format: StorageFormats = StorageFormats.CSV) -> pd.DataFrame:
+    if storage_format == StorageFormats.PARQUET:
+        return pd.read_parquet(path)
+    if storage_format == StorageFormats.FEATHER:
+        return pd.read_feather(path)
+    return pd.read_csv(path)
@@ -0,0 +1,165 @@
+import gzip
+import pathlib
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterator, List, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+
+from thesis_readers.misc.storage import StorageFormats
+
+CASE_PREFIX = "case:"
+ATTRIBUTE_TAGS = ["string", "date", "int", "float", "boolean", "id"]
+XES_ARROW_TYPES = {
+    "string": pa.string(),
+    "id": pa.string(),
+    "date": pa.timestamp("ns", tz="UTC"),
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "boolean": pa.bool_(),
+}
+
+
+class ColumnBuffer():
+    """Collects event rows column by column and turns them into a typed DataFrame."""
+    def __init__(self) -> None:
+        self.columns: Dict[str, List] = {}
+        self.num_rows = 0
+
+    def append(self, row: Dict[str, str]):
+        for key, val in row.items():
+            if key not in self.columns:
+                self.columns[key] = [None] * self.num_rows
+            self.columns[key].append(val)
+        self.num_rows += 1
+        for col in self.columns.values():
+            if len(col) < self.num_rows:
+                col.append(None)
+
+    def to_frame(self, all_types: Dict[str, str]) -> pd.DataFrame:
+        # Columns that were seen in earlier chunks are added as well, so all chunks share one schema
+        df = pd.DataFrame({key: self._convert(self.columns.get(key, [None] * self.num_rows), xes_type) for key, xes_type in all_types.items()})
+        self.columns, self.num_rows = {}, 0
+        return df
+
+    @staticmethod
+    def _convert(values: List[str], xes_type: str) -> pd.Series:
+        values = pd.Series(values, dtype='object')
+        if xes_type == "date":
+            return pd.to_datetime(values, utc=True)
+        if xes_type == "int":
+            return pd.to_numeric(values)
+        if xes_type == "float":
+            return pd.to_numeric(values).astype('float64')
+        if xes_type == "boolean":
+            return values.map({"true": True, "false": False})
+        return values
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _iter_xes_traces(path: pathlib.Path, show_progress: bool = True, desc: str = "Parse") -> Iterator[List[Dict[str, Tuple[str, str]]]]:
+    # Yields the events of every trace as rows of key -> (value, xes type)
+    path = pathlib.Path(path)
+    is_compressed = path.suffix == ".gz"
+    raw_file = open(path, 'rb')
+    file = gzip.open(raw_file) if is_compressed else raw_file
+    progress = tqdm(total=path.stat().st_size, unit='B', unit_scale=True, desc=f"{desc} {path.name}", disable=not show_progress)
+
+    stack: List[str] = []
+    root = None
+    trace_attributes, trace_events, event = {}, [], None
+    last_position = 0
+    try:
+        for action, elem in ET.iterparse(file, events=("start", "end")):
+            tag = _local_name(elem.tag)
+            if action == "start":
+                root = elem if root is None else root
+                stack.append(tag)
+                if tag == "trace":
+                    trace_attributes, trace_events = {}, []
+                if tag == "event":
+                    event = {}
+                continue
+
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if tag in ATTRIBUTE_TAGS and parent == "event":
+                event[elem.get("key")] = (elem.get("value"), tag)
+            if tag in ATTRIBUTE_TAGS and parent == "trace":
+                trace_attributes[CASE_PREFIX + elem.get("key")] = (elem.get("value"), tag)
+            if tag == "event" and parent == "trace":
+                trace_events.append(event)
+            if tag != "trace":
+                continue
+
+            # Trace attributes may follow the events, hence rows are only emitted once the trace is complete
+            yield [dict(trace_event, **trace_attributes) for trace_event in trace_events]
+            # Drops every finished trace so the parsed tree never grows beyond a single trace
+            root.clear()
+            position = raw_file.tell()
+            progress.update(position - last_position)
+            last_position = position
+    finally:
+        progress.close()
+        file.close()
+        raw_file.close()
+
+
+def scan_xes_types(path: pathlib.Path, show_progress: bool = True) -> Dict[str, str]:
+    """Collects the column names of iter_xes_chunks with their xes type, without keeping any events."""
+    all_types: Dict[str, str] = {}
+    for rows in _iter_xes_traces(path, show_progress, "Scan"):
+        for row in rows:
+            all_types.update({key: xes_type for key, (_, xes_type) in row.items() if key not in all_types})
+    return all_types
+
+
+def iter_xes_chunks(path: pathlib.Path, chunk_size: int = 100000, show_progress: bool = True, all_types: Dict[str, str] = None) -> Iterator[pd.DataFrame]:
+    """Parses an XES file incrementally and yields its events as DataFrames of about chunk_size rows.
+
+    The columns follow pm4py.convert_to_dataframe: event attributes keep their key and trace attributes are prefixed with 'case:'.
+    Nested attributes, globals and log attributes are skipped. Every chunk has the columns seen so far, or all columns in all_types.
+    """
+    buffer = ColumnBuffer()
+    all_types = dict(all_types or {})
+    for rows in _iter_xes_traces(path, show_progress):
+        for row in rows:
+            all_types.update({key: xes_type for key, (_, xes_type) in row.items() if key not in all_types})
+            buffer.append({key: val for key, (val, _) in row.items()})
+        if buffer.num_rows >= chunk_size:
+            yield buffer.to_frame(all_types)
+    if buffer.num_rows:
+        yield buffer.to_frame(all_types)
+
+
+def read_xes_frame(path: pathlib.Path, chunk_size: int = 100000, show_progress: bool = True) -> pd.DataFrame:
+    """Only the parsing is bounded by chunk_size, the returned frame holds the whole log. See write_xes_frame to store a log chunk by chunk."""
+    chunks = list(iter_xes_chunks(path, chunk_size, show_progress))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def write_xes_frame(path: pathlib.Path, out_path: pathlib.Path, storage_format: StorageFormats = StorageFormats.PARQUET, chunk_size: int = 100000, show_progress: bool = True) -> pathlib.Path:
+    """Writes the events of an XES file to out_path one chunk at a time, so at most chunk_size events are in memory.
+
+    The file is parsed twice, because the writers need every column and type before the first chunk.
+    """
+    all_types = scan_xes_types(path, show_progress)
+    chunks = iter_xes_chunks(path, chunk_size, show_progress, all_types)
+    if storage_format == StorageFormats.CSV:
+        pd.DataFrame(columns=list(all_types)).to_csv(out_path, index=False)
+        for chunk in chunks:
+            chunk.to_csv(out_path, index=False, header=False, mode='a')
+        return out_path
+
+    schema = pa.schema([(key, XES_ARROW_TYPES[xes_type]) for key, xes_type in all_types.items()])
+    # Feather files are arrow IPC files, so both formats can be appended to table by table
+    writer = pq.ParquetWriter(out_path, schema) if storage_format == StorageFormats.PARQUET else pa.ipc.new_file(out_path, schema)
+    with writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    return out_path
@@ -1,7 +1,9 @@
 import time
 import random
+import inspect
+import tracemalloc
 from enum import IntEnum, auto, Enum
-from typing import Counter, Dict, Iterable, Iterator, List, Tuple, Union
+from typing import Callable, Counter, Dict, Iterable, Iterator, List, Tuple, Union
 import pathlib
 from matplotlib import pyplot as plt
 import pandas as pd
@@ -26,10 +28,14 @@ from pm4py.visualization.bpmn import visualizer as bpmn_visualizer
 from pm4py.visualization.heuristics_net import visualizer as hn_visualizer
 from sklearn import preprocessing
 import itertools as it
+import hashlib
 from sklearn.preprocessing import StandardScaler
 from scipy.stats import entropy
 
 from thesis_readers.misc.constants import DATA_FOLDER, DATA_FOLDER_PREPROCESSED, DATA_FOLDER_VISUALIZATION
+from thesis_readers.misc.cache import DatasetCache
+from thesis_readers.misc.storage import StorageFormats, load_event_frame, save_event_frame
+from thesis_readers.misc.xes import read_xes_frame, write_xes_frame
 
 TO_EVENT_LOG = log_converter.Variants.TO_EVENT_LOG
 
@@ -37,6 +43,7 @@ TO_EVENT_LOG = log_converter.Variants.TO_EVENT_LOG
 class TaskModes(Enum):
     NEXT_EVENT_EXTENSIVE = auto()
     NEXT_EVENT = auto()
+    NEXT_EVENT_LAZY = auto()
     OUTCOME = auto()
     OUTCOME_EXTENSIVE = auto()
     # ENCODER_DECODER = auto()
@@ -70,7 +77,7 @@ class FeatureModes(IntEnum):
 class AbstractProcessLogReader():
     """DatasetBuilder for my_dataset dataset."""
 
-    log = None
+    _log = None
     log_path: str = None
     _original_data: pd.DataFrame = None
     data: pd.DataFrame = None
@@ -83,7 +90,6 @@ class AbstractProcessLogReader():
     end_token: str = "<E>"
     start_token: str = "<S>"
     transform = None
-    time_stats = {}
 
     def __init__(self,
                  log_path: str,
@@ -94,19 +100,41 @@ class AbstractProcessLogReader():
                  debug=False,
                  mode: TaskModes = TaskModes.NEXT_EVENT_EXTENSIVE,
                  max_tokens: int = None,
+                 use_cache: bool = False,
+                 storage_format: StorageFormats = StorageFormats.CSV,
+                 stats_sample_size: int = None,
                  **kwargs) -> None:
         super(AbstractProcessLogReader, self).__init__(**kwargs)
+        self.time_stats = {}
         self.vocab_len = None
         self.debug = debug
         self.mode = mode
+        self.use_cache = use_cache
         self.log_path = pathlib.Path(log_path)
         self.csv_path = pathlib.Path(csv_path)
+        self.storage_format = storage_format
+        self.preprocessed_path = self.csv_path.with_suffix(storage_format.value)
+        self.stats_sample_size = stats_sample_size
+        self._column_stats = None
         self.col_case_id = col_case_id
         self.col_activity_id = col_event_id
         self.col_timestamp = col_timestamp
         self.preprocessors = {}
+        self._cache_params = None
+        self._source_fingerprint = None
+
+    def init_log(self, save=False, streaming=False, chunk_size=100000):
+        if streaming:
+            # Parses the XES without building the pm4py log in memory
+            self._log = None
+            if save:
+                # Goes chunk by chunk into the preprocessed file, from which init_data reads the events
+                write_xes_frame(self.log_path, self.preprocessed_path, self.storage_format, chunk_size)
+                self._original_data = None
+                return self
+            self._original_data = read_xes_frame(self.log_path, chunk_size)
+            return self
 
-    def init_log(self, save=False):
         self.log = pm4py.read_xes(self.log_path.as_posix())
         if self.debug:
             print(self.log[1])  #prints the first event of the first trace of the given log
@@ -114,24 +142,27 @@ class AbstractProcessLogReader():
             print(self.log[1][0])  #prints the first event of the first trace of the given log
         self._original_data = pm4py.convert_to_dataframe(self.log)
         if save:
-            self._original_data.to_csv(self.csv_path, index=False)
+            self._save_original_data()
         return self
 
-    def init_data(self):
+    def init_data(self, track_memory: bool = False):
+        if track_memory:
+            tracemalloc.start()
         start_time = time.time()
-
-        self._original_data = self._original_data if self._original_data is not None else pd.read_csv(self.csv_path)
-        self._original_data = dataframe_utils.convert_timestamp_columns_in_df(
-            self._original_data,
-            timest_columns=[self.col_timestamp],
-        )
+        if self.use_cache:
+            # Taken before the data is loaded, so later calls of cache refer to the entry of this run
+            self._source_fingerprint = self._fingerprint_original_data() if self._original_data is not None else None
+        cache = self.cache if self.use_cache else None
+        if cache is not None and cache.exists():
+            self._load_from_cache(cache)
+            self.time_stats["cache_hit"] = time.time() - start_time
+            self._finish_init_data(start_time, track_memory)
+            return self
+
+        self._original_data = self._load_original_data()
         if self.debug:
             display(self._original_data.head())
 
-        parameters = {TO_EVENT_LOG.value.Parameters.CASE_ID_KEY: self.col_case_id}
-        self.log = self.log if self.log is not None else log_converter.apply(self._original_data, parameters=parameters, variant=TO_EVENT_LOG)
-        self._original_data[self.col_case_id] = self._original_data[self.col_case_id].astype('object')
-        self._original_data[self.col_activity_id] = self._original_data[self.col_activity_id].astype('object')
         self.preprocess_level_general()
         self.preprocess_level_specialized()
         self.register_vocabulary()
@@ -139,7 +170,145 @@ class AbstractProcessLogReader():
         self.gather_information_about_traces()
         self.instantiate_dataset()
 
+        if cache is not None:
+            cache_start_time = time.time()
+            self._save_to_cache(cache)
+            self.time_stats["cache_miss"] = time.time() - cache_start_time
+
+        self._finish_init_data(start_time, track_memory)
+        return self
+
+    def _finish_init_data(self, start_time: float, track_memory: bool = False):
         self.time_stats["full_data_preprocessing_pipeline"] = time.time() - start_time
+        if track_memory:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.time_stats["full_data_preprocessing_pipeline_peak_memory_mb"] = peak_memory / 2**20
+
+    def _load_original_data(self) -> pd.DataFrame:
+        original_data = self._original_data if self._original_data is not None else load_event_frame(self.preprocessed_path, self.storage_format)
+        original_data = dataframe_utils.convert_timestamp_columns_in_df(
+            original_data,
+            timest_columns=[self.col_timestamp],
+        )
+        # Columnar formats store these as categoricals, but the preprocessing expects plain objects
+        original_data[self.col_case_id] = original_data[self.col_case_id].astype('object')
+        original_data[self.col_activity_id] = original_data[self.col_activity_id].astype('object')
+        return original_data
+
+    def _build_log(self):
+        start_time = time.time()
+        parameters = {TO_EVENT_LOG.value.Parameters.CASE_ID_KEY: self.col_case_id}
+        log = log_converter.apply(self._load_original_data(), parameters=parameters, variant=TO_EVENT_LOG)
+        self.time_stats["event_log_conversion"] = time.time() - start_time
+        return log
+
+    @property
+    def log(self):
+        if self._log is None:
+            self._log = self._build_log()
+        return self._log
+
+    @log.setter
+    def log(self, log):
+        self._log = log
+
+    def _save_original_data(self):
+        save_event_frame(self._original_data, self.preprocessed_path, self.storage_format, categorical_cols=[self.col_case_id, self.col_activity_id])
+        return self
+
+    @property
+    def cache(self) -> DatasetCache:
+        if self._cache_params is None:
+            # Collected on first use instead of in __init__, so attributes that subclasses set after super().__init__ are part of the key
+            self._cache_params = self._collect_cache_params()
+        return DatasetCache(type(self).__name__, self._cache_config())
+
+    def _collect_cache_params(self):
+        # The attributes restored from the cache are results of the preprocessing, not settings
+        excluded = ["debug", "use_cache", "_source_fingerprint"] + self._cached_attributes
+        return {key: val for key, val in vars(self).items() if isinstance(val, (str, int, float, tuple, Enum, pathlib.Path)) and key not in excluded}
+
+    def _fingerprint_original_data(self) -> str:
+        hashes = pd.util.hash_pandas_object(self._original_data, index=False).values
+        return hashlib.sha1(str(list(self._original_data.columns)).encode('utf-8') + hashes.tobytes()).hexdigest()
+
+    def _cache_source(self) -> dict:
+        if self._source_fingerprint is not None:
+            # Frames passed in memory may differ from the file on disk, so they are keyed by their content
+            return {"source": "memory", "source_fingerprint": self._source_fingerprint}
+        source = self.preprocessed_path if self.preprocessed_path.exists() else self.log_path
+        return {"source": source.as_posix(), "source_mtime": source.stat().st_mtime if source.exists() else None}
+
+    def _cache_config(self):
+        preprocessing_steps = ["preprocess_level_general", "preprocess_level_specialized", "register_vocabulary", "instantiate_dataset"]
+        # Hashing the source of every preprocessing step also captures the thresholds hardcoded by the subclasses
+        preprocessing_code = [inspect.getsource(vars(cls)[step]) for cls in type(self).__mro__ for step in preprocessing_steps if step in vars(cls)]
+        return {
+            "reader": f"{type(self).__module__}.{type(self).__qualname__}",
+            "params": self._cache_params,
+            **self._cache_source(),
+            "preprocessing": hashlib.sha1("".join(preprocessing_code).encode('utf-8')).hexdigest(),
+        }
+
+    def _save_to_cache(self, cache: DatasetCache):
+        arrays = {
+            "data_container": self.data_container,
+            "traces": self.traces,
+            "targets": self.targets,
+            "idx_train": self.idx_train,
+            "idx_val": self.idx_val,
+            "idx_test": self.idx_test,
+        }
+        if self.traces is self.data_container:
+            del arrays["traces"]
+        meta = {attr: getattr(self, attr) for attr in self._cached_attributes}
+        cache.save(arrays, meta, self.data)
+        print(f"Cached preprocessed data in {cache.path}")
+        # Entries of the same reader and settings were built from an older source or older preprocessing code
+        num_pruned = cache.prune(["reader", "params"])
+        if num_pruned:
+            print(f"Removed {num_pruned} superseded cache entries")
+
+    def _load_from_cache(self, cache: DatasetCache):
+        print(f"Load preprocessed data from {cache.path}")
+        arrays, meta, self.data = cache.load()
+        for attr in self._cached_attributes:
+            setattr(self, attr, meta[attr])
+        self.data_container = arrays["data_container"]
+        self._data_container_tensor = None
+        self._column_stats = None
+        self.traces = arrays.get("traces", self.data_container)
+        self.targets = arrays["targets"]
+        self.idx_train, self.idx_val, self.idx_test = arrays["idx_train"], arrays["idx_val"], arrays["idx_test"]
+        self.feature_types = (tf.float32, tf.float32, tf.float32, tf.float32)
+        self._assign_splits()
+
+    @property
+    def _cached_attributes(self):
+        return [
+            "_vocab",
+            "_vocab_r",
+            "vocab_len",
+            "preprocessors",
+            "col_timestamp_all",
+            "length_distribution",
+            "max_len",
+            "min_len",
+            "log_len",
+            "feature_len",
+            "idx_event_attribute",
+            "idx_time_attributes",
+            "idx_features",
+            "idx_binary_features",
+            "idx_continuous_features",
+            "feature_shapes",
+        ]
+
+    def invalidate_cache(self, all_entries: bool = False):
+        cache = self.cache
+        num_removed = cache.clear_all() if all_entries else int(cache.clear())
+        print(f"Removed {num_removed} cache entries for {type(self).__name__}")
         return self
 
     # @staticmethod
@@ -151,7 +320,7 @@ class AbstractProcessLogReader():
         self.data = self.original_data
         if remove_cols:
             self.data = self.data.drop(remove_cols, axis=1)
-        col_statistics = self._gather_column_statsitics(self.data.select_dtypes('object'))
+        col_statistics = self._gather_column_statsitics(self.data.select_dtypes('object'), self.stats_sample_size)
         col_statistics = {
             col: dict(stats, is_useless=self._is_useless_col(stats, min_diversity, max_diversity_thresh, too_similar_thresh, missing_thresh))
             for col, stats in col_statistics.items() if col not in [self.col_case_id, self.col_activity_id, self.col_timestamp]
@@ -166,24 +335,61 @@ class AbstractProcessLogReader():
         is_missing_too_many = stats.get("missing_ratio") > missing_ratio_thresh
         return (not has_reasonable_diversity), is_probably_unique_to_case, is_missing_too_many
 
-    def _gather_column_statsitics(self, df: pd.DataFrame):
+    def _gather_column_statsitics(self, df: pd.DataFrame, sample_size: int = None):
+        start_time = time.time()
         full_len = len(df)
         num_traces = df[self.col_case_id].nunique(False)
-        results = {
-            col: {
+        is_sampled = sample_size is not None and sample_size < full_len
+        sample = df.sample(sample_size, random_state=42) if is_sampled else df
+        sample_len = len(sample)
+        missing_ratios = sample.isna().mean()
+
+        results = {}
+        for col in df.columns:
+            col_start_time = time.perf_counter()
+            if is_sampled:
+                num_unique, num_unique_bounds = self._estimate_num_unique(sample[col], full_len)
+            else:
+                num_unique = sample[col].nunique(False)
+            results[col] = {
                 'name': col,
-                'diversity': df[col].nunique(False) / full_len,
+                'diversity': num_unique / full_len,
                 'dtype': str(df[col].dtype),
-                'missing_ratio': df[col].isna().sum() / full_len,
-                'similarity_to_trace_num': 1 - (np.abs(df[col].nunique(False) - num_traces) / np.max([df[col].nunique(False), num_traces])),
-                '_num_unique': df[col].nunique(False),
+                'missing_ratio': missing_ratios[col],
+                'similarity_to_trace_num': 1 - (np.abs(num_unique - num_traces) / np.max([num_unique, num_traces])),
+                '_num_unique': num_unique,
                 '_num_rows': full_len,
                 '_num_traces': num_traces,
             }
-            for col in df.columns
-        }
+            if is_sampled:
+                # 95% normal approximation for the missing ratio
+                missing_error = 1.96 * np.sqrt(missing_ratios[col] * (1 - missing_ratios[col]) / sample_len)
+                results[col].update({
+                    '_sample_size': sample_len,
+                    '_num_unique_bounds': num_unique_bounds,
+                    '_missing_ratio_bounds': (float(max(missing_ratios[col] - missing_error, 0)), float(min(missing_ratios[col] + missing_error, 1))),
+                })
+            results[col]['_seconds'] = time.perf_counter() - col_start_time
+        self.time_stats["column_statistics"] = self.time_stats.get("column_statistics", 0) + time.time() - start_time
         return results
 
+    @staticmethod
+    def _estimate_num_unique(sample: pd.Series, full_len: int):
+        # Guaranteed-Error Estimator (Charikar et al., 2000): every value seen once in the sample stands for sqrt(N/n) distinct values.
+        # The bounds take no unseen values at all or N/n distinct values per singleton.
+        counts = sample.value_counts(dropna=False)
+        num_seen, num_singletons = len(counts), int((counts == 1).sum())
+        scale = full_len / len(sample)
+        estimate = np.sqrt(scale) * num_singletons + (num_seen - num_singletons)
+        upper_bound = min(full_len, (num_seen - num_singletons) + scale * num_singletons)
+        return int(round(estimate)), (num_seen, int(upper_bound))
+
+    @property
+    def column_stats(self):
+        if self._column_stats is None:
+            self._column_stats = self._gather_column_statsitics(self.data.reset_index(), self.stats_sample_size)
+        return self._column_stats
+
     def preprocess_level_specialized(self, **kwargs):
         cols = kwargs.get('cols', self.data.columns)
         # Prepare remaining columns
@@ -222,32 +428,33 @@ class AbstractProcessLogReader():
         self._vocab_r = {idx: word for word, idx in self._vocab.items()}
 
     def group_rows_into_traces(self):
-        self.data = self.data.replace({self.col_activity_id: self._vocab})
-        self.grouped_traces = list(self.data.groupby(by=self.col_case_id))
-        self._traces = {idx: df for idx, df in self.grouped_traces}
+        self.data = self.data.assign(**{self.col_activity_id: self.data[self.col_activity_id].map(self._vocab)})
+        # A stable sort keeps the event order within each case and the case order of groupby
+        self.data = self.data.sort_index(kind='stable')
+        self._trace_dict = None
 
     def gather_information_about_traces(self):
-        self.length_distribution = Counter([len(tr) for tr in self._traces.values()])
+        trace_lengths = self.data.groupby(by=self.col_case_id, sort=False).size().values
+        self.length_distribution = Counter(trace_lengths.tolist())
         self.max_len = max(list(self.length_distribution.keys())) + 2
         self.min_len = min(list(self.length_distribution.keys())) + 2
-        self.log_len = len(self._traces)
+        self.log_len = len(trace_lengths)
         self.feature_len = len(self.data.columns)
         self.idx_event_attribute = self.data.columns.get_loc(self.col_activity_id)
         self.idx_time_attributes = [self.data.columns.get_loc(col) for col in self.col_timestamp_all]
         self.idx_features = [self.data.columns.get_loc(col) for col in self.data.columns if col not in [self.col_activity_id, self.col_case_id, self.col_timestamp]]
+        # BaseN encoded categoricals only hold 0/1 and are stored as uint8, everything else as float32
+        is_binary = [bool(self.data.iloc[:, idx].isin([0, 1]).all()) for idx in self.idx_features]
+        self.idx_binary_features = [idx for idx, binary in zip(self.idx_features, is_binary) if binary]
+        self.idx_continuous_features = [idx for idx, binary in zip(self.idx_features, is_binary) if not binary]
         self.feature_shapes = ((self.max_len, ), (self.max_len, self.feature_len - 1), (self.max_len, self.feature_len), (self.max_len, self.feature_len))
         self.feature_types = (tf.float32, tf.float32, tf.float32, tf.float32)
 
     def instantiate_dataset(self):
         print("Preprocess data")
-        self.data_container = np.zeros([self.log_len, self.max_len, self.feature_len])
-        loader = tqdm(self._traces.items(), total=len(self._traces))
-
-        for idx, (case_id, df) in enumerate(loader):
-            df_end = len(df)
-            self.data_container[idx, -df_end:] = df.values
-            # self.data_container[idx, -1, self.idx_event_attribute] = self.vocab2idx[self.end_token]
-            self.data_container[idx, -df_end - 1, self.idx_event_attribute] = self.vocab2idx[self.start_token]
+        self.data_container = self._tensorize_traces()
+        self._data_container_tensor = None
+        self._column_stats = None
 
         if self.mode == TaskModes.NEXT_EVENT_EXTENSIVE:
             all_next_activities = self._get_next_activities()
@@ -255,15 +462,19 @@ class AbstractProcessLogReader():
 
         if self.mode == TaskModes.NEXT_EVENT:
             all_next_activities = self._get_next_activities()
-            tmp = [(ft[:idx], tg[idx - 1]) for ft, tg in zip(self.data_container, all_next_activities) for idx in range(1, len(ft)) if (ft[:idx].sum() != 0) and (tg[idx - 1] != 0)]
-            # tmp2 = list(zip(*tmp))
-            features_container = np.zeros([len(tmp), self.max_len, self.feature_len])
-            target_container = np.zeros([len(tmp), 1], dtype=np.int32)
-            for idx, (ft, tg) in enumerate(tmp):
-                features_container[idx, -len(ft):] = ft
-                target_container[idx] = tg
+            trace_indices, cutoffs = self._get_prefix_indices(self.data_container, all_next_activities)
+            features_container = self._get_prefix_windows(self.data_container)[trace_indices, cutoffs]
+            target_container = all_next_activities[trace_indices, cutoffs - 1][:, None].astype(np.int32)
             self.traces = features_container, target_container
 
+        if self.mode == TaskModes.NEXT_EVENT_LAZY:
+            # Same examples as NEXT_EVENT, but only the (trace, cutoff) pairs are kept. The prefixes are built in get_dataset.
+            all_next_activities = self._get_next_activities()
+            trace_indices, cutoffs = self._get_prefix_indices(self.data_container, all_next_activities)
+            prefix_index = np.stack([trace_indices, cutoffs], axis=-1)
+            target_container = all_next_activities[trace_indices, cutoffs - 1][:, None].astype(np.int32)
+            self.traces = prefix_index, target_container
+
         # if self.mode == TaskModes.ENCODER_DECODER:
         #     self.traces = ([idx, tr[0:split], tr[split:]] for idx, tr in loader if len(tr) > 1 for split in [random.randint(1, len(tr))])
 
@@ -286,7 +497,7 @@ class AbstractProcessLogReader():
             all_next_activities = self._get_next_activities()
             self.data_container = np.roll(self.data_container, 1, axis=1)
             self.data_container[:, 0] = 0
-            mask = np.not_equal(self.data_container[:, :, self.idx_event_attribute], 0)
+            mask = np.not_equal(self._get_events(self.data_container), 0)
             out_come = all_next_activities[:, -2][:, None]
             extensive_out_come = mask * out_come
             self.traces = self.data_container, extensive_out_come
@@ -294,17 +505,102 @@ class AbstractProcessLogReader():
 
         self.traces, self.targets = self.traces
 
-        self.trace_data, self.trace_test, self.target_data, self.target_test = train_test_split(self.traces, self.targets)
-        self.trace_train, self.trace_val, self.target_train, self.target_val = train_test_split(self.trace_data, self.target_data)
+        idx_data, self.idx_test = train_test_split(np.arange(len(self.traces)))
+        self.idx_train, self.idx_val = train_test_split(idx_data)
+        self._assign_splits()
+
+    def _assign_splits(self):
+        self.trace_train, self.target_train = self.traces[self.idx_train], self.targets[self.idx_train]
+        self.trace_val, self.target_val = self.traces[self.idx_val], self.targets[self.idx_val]
+        self.trace_test, self.target_test = self.traces[self.idx_test], self.targets[self.idx_test]
 
         print(f"Test: {len(self.trace_test)} datapoints")
         print(f"Train: {len(self.trace_train)} datapoints")
         print(f"Val: {len(self.trace_val)} datapoints")
 
+    @property
+    def container_dtype(self) -> np.dtype:
+        # One record per event instead of feature_len float64 values
+        return np.dtype([
+            ("event", np.int16 if self.vocab_len <= np.iinfo(np.int16).max else np.int32),
+            ("binary", np.uint8, (len(self.idx_binary_features), )),
+            ("continuous", np.float32, (len(self.idx_continuous_features), )),
+        ])
+
+    def _to_compact(self, values: np.ndarray) -> np.ndarray:
+        # Splits rows laid out like self.data.columns into the fields of container_dtype
+        compact = np.zeros(values.shape[:-1], dtype=self.container_dtype)
+        compact["event"] = values[..., self.idx_event_attribute]
+        compact["binary"] = values[..., self.idx_binary_features]
+        compact["continuous"] = values[..., self.idx_continuous_features]
+        return compact
+
+    def _tensorize_traces(self) -> np.ndarray:
+        data_container = np.zeros([self.log_len, self.max_len], dtype=self.container_dtype)
+        grouped = self.data.groupby(by=self.col_case_id, sort=False)
+        trace_indices = grouped.ngroup().values
+        trace_lengths = grouped.size().values
+        # Traces are right aligned and the start token sits right before the first event
+        positions = grouped.cumcount().values + (self.max_len - trace_lengths[trace_indices])
+        data_container[trace_indices, positions] = self._to_compact(self.data.values)
+        data_container["event"][np.arange(self.log_len), self.max_len - trace_lengths - 1] = self.start_id
+        return data_container
+
+    def _tensorize_traces_per_trace(self) -> np.ndarray:
+        data_container = np.zeros([self.log_len, self.max_len], dtype=self.container_dtype)
+        loader = tqdm(self._traces.items(), total=len(self._traces))
+
+        for idx, (case_id, df) in enumerate(loader):
+            df_end = len(df)
+            data_container[idx, -df_end:] = self._to_compact(df.values)
+            # data_container[idx, -1, self.idx_event_attribute] = self.vocab2idx[self.end_token]
+            data_container["event"][idx, -df_end - 1] = self.vocab2idx[self.start_token]
+        return data_container
+
+    def _get_events(self, features: np.ndarray) -> np.ndarray:
+        return features["event"] if features.dtype.names else features[..., self.idx_event_attribute]
+
+    def _gather_columns(self, features: np.ndarray, cols: List[int]) -> np.ndarray:
+        # Assembles the columns of self.data given by cols as float32, whether features is compact or a plain float array
+        if not features.dtype.names:
+            return features[..., cols]
+        layout = self.idx_binary_features + self.idx_continuous_features
+        stacked = np.concatenate([features["binary"].astype(np.float32), features["continuous"]], axis=-1)
+        return stacked[..., [layout.index(col) for col in cols]]
+
+    def _get_row_sums(self, features: np.ndarray) -> np.ndarray:
+        if not features.dtype.names:
+            return features.sum(axis=-1)
+        return features["event"] + features["binary"].sum(axis=-1) + features["continuous"].sum(axis=-1, dtype=np.float64)
+
+    def _get_prefix_indices(self, data_container: np.ndarray, all_next_activities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # A prefix ft[:cutoff] is valid if it is not all padding and its next activity is not padding
+        is_non_empty = np.cumsum(self._get_row_sums(data_container), axis=1)[:, :-1] != 0
+        has_target = all_next_activities[:, :-1] != 0
+        trace_indices, positions = np.nonzero(is_non_empty & has_target)
+        return trace_indices, positions + 1
+
+    def _get_prefix_windows(self, data_container: np.ndarray) -> np.ndarray:
+        # Read-only view of shape (log_len, max_len + 1, max_len) without copying any prefix.
+        # Window [i, c] is ft[:c] left padded to max_len, because the trace is prepended with max_len zero rows.
+        padded = np.concatenate([np.zeros_like(data_container), data_container], axis=1)
+        stride_trace, stride_pos = padded.strides[:2]
+        shape = (len(padded), self.max_len + 1, self.max_len) + padded.shape[2:]
+        strides = (stride_trace, stride_pos, stride_pos) + padded.strides[2:]
+        return np.lib.stride_tricks.as_strided(padded, shape, strides, writeable=False)
+
+    def iter_prefix_batches(self, batch_size: int = 1000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Yields the NEXT_EVENT prefixes and targets of data_container in batches instead of materializing all of them."""
+        all_next_activities = self._get_next_activities()
+        trace_indices, cutoffs = self._get_prefix_indices(self.data_container, all_next_activities)
+        windows = self._get_prefix_windows(self.data_container)
+        for start in range(0, len(trace_indices), batch_size):
+            batch_traces, batch_cutoffs = trace_indices[start:start + batch_size], cutoffs[start:start + batch_size]
+            yield windows[batch_traces, batch_cutoffs], all_next_activities[batch_traces, batch_cutoffs - 1][:, None].astype(np.int32)
+
     def _get_next_activities(self):
-        next_line = np.roll(self.data_container, -1, axis=1)
-        next_line[:, -1, self.idx_event_attribute] = self.vocab2idx[self.end_token]
-        all_next_activities = next_line[:, :, self.idx_event_attribute].astype(int)
+        all_next_activities = np.roll(self._get_events(self.data_container), -1, axis=1).astype(int)
+        all_next_activities[:, -1] = self.vocab2idx[self.end_token]
         all_next_activities[all_next_activities == self.start_id] = 0
         return all_next_activities
 
@@ -361,12 +657,22 @@ class AbstractProcessLogReader():
             "num_distinct_events": self._num_distinct_events,
             "time": self.time_stats,
             "time_unit": "seconds",
-            "column_stats": self._gather_column_statsitics(self.data.reset_index()),
+            "column_stats": self.column_stats,
         }
 
     # TODO: Change to less complicated output
     def _generate_examples(self, data_mode: int = DatasetModes.TRAIN, ft_mode: int = FeatureModes.EVENT_ONLY) -> Iterator:
         """Generator of examples for each split."""
+        data = self._get_split(data_mode)
+
+        res_features, res_targets = self._prepare_input_data(*data, ft_mode)
+
+        # for trace, target in zip(zip(*res_features), zip(*res_targets)):
+        #     yield (trace, target)
+        # return zip(zip(*res_features), zip(*res_targets))
+        return res_features, res_targets
+
+    def _get_split(self, data_mode: int = DatasetModes.TRAIN) -> Tuple[np.ndarray, np.ndarray]:
         data = None
 
         if DatasetModes(data_mode) == DatasetModes.TRAIN:
@@ -375,13 +681,7 @@ class AbstractProcessLogReader():
             data = (self.trace_val, self.target_val)
         if DatasetModes(data_mode) == DatasetModes.TEST:
             data = (self.trace_test, self.target_test)
-
-        res_features, res_targets = self._prepare_input_data(*data, ft_mode)
-
-        # for trace, target in zip(zip(*res_features), zip(*res_targets)):
-        #     yield (trace, target)
-        # return zip(zip(*res_features), zip(*res_targets))
-        return res_features, res_targets
+        return data
 
     def _prepare_input_data(
             self,
@@ -391,40 +691,204 @@ class AbstractProcessLogReader():
     ) -> tuple:
         res_features = None
         res_targets = None
+        events = self._get_events(features).astype(np.float32)
         if ft_mode == FeatureModes.EVENT_ONLY:
-            res_features = features[:, :, self.idx_event_attribute]
+            res_features = events
         if ft_mode == FeatureModes.EVENT_TIME_SEP:
-            res_features = (features[:, :, self.idx_event_attribute], features[:, :, self.idx_time_attributes])
+            res_features = (events, self._gather_columns(features, self.idx_time_attributes))
         if ft_mode == FeatureModes.EVENT_TIME:
-            res_features = np.concatenate([to_categorical(features[:, :, self.idx_event_attribute]), features[:, :, self.idx_time_attributes]], axis=-1)
+            res_features = np.concatenate([to_categorical(events, self.onehot_len), self._gather_columns(features, self.idx_time_attributes)], axis=-1)
         if ft_mode == FeatureModes.FULL_SEP:
-            res_features = (features[:, :, self.idx_event_attribute], features[:, :, self.idx_features])
+            res_features = (events, self._gather_columns(features, self.idx_features))
         if ft_mode == FeatureModes.FEATURES_ONLY:
-            res_features = features[:, :, self.idx_features]
+            res_features = self._gather_columns(features, self.idx_features)
         if ft_mode == FeatureModes.FULL:
-            res_features = np.concatenate([to_categorical(features[:, :, self.idx_event_attribute]), features[:, :, self.idx_features]], axis=-1)
+            res_features = np.concatenate([to_categorical(events, self.onehot_len), self._gather_columns(features, self.idx_features)], axis=-1)
         if ft_mode == FeatureModes.EVENT_ONLY_ONEHOT:
-            res_features = to_categorical(features[:, :, self.idx_event_attribute])
+            res_features = to_categorical(events, self.onehot_len)
 
         if targets is not None:
             res_targets = targets
             return res_features, res_targets
         return res_features, None
 
+    def _prepare_input_tensors(self, features: Dict[str, tf.Tensor], ft_mode: int = FeatureModes.EVENT_ONLY):
+        # Graph version of _prepare_input_data. It runs on batches of compact fields, so one-hot encodings only ever exist per batch.
+        events = tf.cast(features["event"], tf.float32)
+        if ft_mode == FeatureModes.EVENT_ONLY:
+            return events
+        if ft_mode == FeatureModes.EVENT_ONLY_ONEHOT:
+            return self._one_hot_tensor(features["event"])
+        if ft_mode == FeatureModes.EVENT_TIME_SEP:
+            return (events, self._gather_column_tensors(features, self.idx_time_attributes))
+        if ft_mode == FeatureModes.FULL_SEP:
+            return (events, self._gather_column_tensors(features, self.idx_features))
+        if ft_mode == FeatureModes.FEATURES_ONLY:
+            return self._gather_column_tensors(features, self.idx_features)
+        if ft_mode == FeatureModes.EVENT_TIME:
+            return tf.concat([self._one_hot_tensor(features["event"]), self._gather_column_tensors(features, self.idx_time_attributes)], axis=-1)
+        if ft_mode == FeatureModes.FULL:
+            return tf.concat([self._one_hot_tensor(features["event"]), self._gather_column_tensors(features, self.idx_features)], axis=-1)
+        return None
+
+    @property
+    def onehot_len(self) -> int:
+        # Width of the one-hot encoded events. Like to_categorical without num_classes it ends at the largest id in the traces, which is the start token.
+        return int(self._get_events(self.data_container).max()) + 1
+
+    def _one_hot_tensor(self, events: tf.Tensor) -> tf.Tensor:
+        return tf.one_hot(tf.cast(events, tf.int32), self.onehot_len, dtype=tf.float32)
+
+    def _gather_column_tensors(self, features: Dict[str, tf.Tensor], cols: List[int]) -> tf.Tensor:
+        layout = self.idx_binary_features + self.idx_continuous_features
+        stacked = tf.concat([tf.cast(features["binary"], tf.float32), features["continuous"]], axis=-1)
+        return tf.gather(stacked, [layout.index(col) for col in cols], axis=-1)
+
+    def _get_required_fields(self, ft_mode: int = FeatureModes.EVENT_ONLY) -> List[str]:
+        if ft_mode in [FeatureModes.EVENT_ONLY, FeatureModes.EVENT_ONLY_ONEHOT]:
+            return ["event"]
+        return ["event", "binary", "continuous"]
+
+    def _build_dataset(self, features: np.ndarray, targets: np.ndarray, batch_size=1, ft_mode: int = FeatureModes.EVENT_ONLY, **pipeline_options) -> tf.data.Dataset:
+        # The dataset holds the compact fields with integer event ids and the FeatureModes view is assembled per batch
+        features = features if features.dtype.names else self._to_compact(features)
+        fields = {field: np.ascontiguousarray(features[field]) for field in self._get_required_fields(ft_mode)}
+        dataset = tf.data.Dataset.from_tensor_slices((fields, targets))
+        return self.build_pipeline(dataset, lambda batch_fields, target: (self._prepare_input_tensors(batch_fields, ft_mode), target), batch_size, **pipeline_options)
+
+    def build_pipeline(
+            self,
+            dataset: tf.data.Dataset,
+            map_fn: Callable,
+            batch_size=1,
+            shuffle_buffer: int = None,
+            cache_path: str = None,
+            num_parallel_calls: int = tf.data.AUTOTUNE,
+            deterministic: bool = True,
+            num_shards: int = None,
+            shard_index: int = 0,
+            prefetch: int = tf.data.AUTOTUNE,
+            seed: int = None,
+    ) -> tf.data.Dataset:
+        """Turns a dataset of single examples into batches of model inputs. map_fn assembles the inputs of a whole batch.
+
+        cache_path None disables caching, an empty string caches in memory and anything else caches to that file.
+        """
+        # The ordering only matters for a parallel map
+        map_options = dict(num_parallel_calls=num_parallel_calls, deterministic=deterministic) if num_parallel_calls else {}
+        if num_shards:
+            dataset = dataset.shard(num_shards, shard_index)
+        if cache_path is not None:
+            # The cache holds the assembled examples, so the map only runs in the first epoch
+            dataset = dataset.batch(batch_size).map(map_fn, **map_options).unbatch()
+            dataset = dataset.cache(str(cache_path))
+        if shuffle_buffer:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+        if cache_path is None:
+            dataset = dataset.map(map_fn, **map_options)
+        if prefetch:
+            dataset = dataset.prefetch(prefetch)
+        return dataset
+
     # def _zip_together(features):
 
-    def get_dataset(self, batch_size=1, data_mode: DatasetModes = DatasetModes.TRAIN, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY):
-        return tf.data.Dataset.from_tensor_slices(self._generate_examples(data_mode, ft_mode)).batch(batch_size)
+    def get_dataset(self, batch_size=1, data_mode: DatasetModes = DatasetModes.TRAIN, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY, bucketed: bool = False, num_buckets: int = 5, **pipeline_options):
+        # pipeline_options are passed on to build_pipeline
+        if self.mode == TaskModes.NEXT_EVENT_LAZY:
+            if bucketed:
+                raise ValueError(f"Bucketing is not supported in {TaskModes.NEXT_EVENT_LAZY} mode")
+            return self._get_lazy_prefix_dataset(batch_size, data_mode, ft_mode, **pipeline_options)
+        if bucketed:
+            return self._get_bucketed_dataset(batch_size, data_mode, ft_mode, num_buckets, **pipeline_options)
+        return self._build_dataset(*self._get_split(data_mode), batch_size, ft_mode, **pipeline_options)
+
+    def get_bucket_boundaries(self, num_buckets: int = 5) -> List[int]:
+        # Equal mass buckets over length_distribution. Like max_len, a boundary leaves room for the start and end token.
+        lengths, counts = zip(*sorted(self.length_distribution.items()))
+        cdf = np.cumsum(counts) / np.sum(counts)
+        quantile_positions = np.searchsorted(cdf, np.arange(1, num_buckets + 1) / num_buckets).clip(max=len(lengths) - 1)
+        boundaries = {lengths[pos] + 2 for pos in quantile_positions}
+        return sorted(boundaries | {self.max_len})
+
+    def _get_sequence_lengths(self, features: np.ndarray) -> np.ndarray:
+        # Sequences are right aligned, so everything before the first non padding event can be cropped
+        is_event = self._get_events(features) != 0
+        return np.where(is_event.any(axis=-1), is_event.shape[-1] - is_event.argmax(axis=-1), 0)
+
+    def _get_bucketed_dataset(self, batch_size=1, data_mode: DatasetModes = DatasetModes.TRAIN, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY, num_buckets: int = 5, **pipeline_options):
+        features, targets = self._get_split(data_mode)
+        boundaries = self.get_bucket_boundaries(num_buckets)
+        bucket_ids = np.searchsorted(boundaries, self._get_sequence_lengths(features))
+        # Sharding happens on the indices, so the number of batches per bucket is known upfront
+        num_shards, shard_index = pipeline_options.pop("num_shards", None), pipeline_options.pop("shard_index", 0)
+        cache_path, prefetch = pipeline_options.pop("cache_path", None), pipeline_options.pop("prefetch", tf.data.AUTOTUNE)
+        datasets, batch_choices = [], []
+        for bucket_id, boundary in enumerate(boundaries):
+            bucket_indices = np.nonzero(bucket_ids == bucket_id)[0]
+            bucket_indices = bucket_indices[shard_index::num_shards] if num_shards else bucket_indices
+            if not len(bucket_indices):
+                continue
+            bucket_features = features[bucket_indices][:, -boundary:]
+            bucket_targets = targets[bucket_indices]
+            # Sequence targets are aligned with the features and get cropped the same way
+            if bucket_targets.ndim > 1 and bucket_targets.shape[1] == self.max_len:
+                bucket_targets = bucket_targets[:, -boundary:]
+            batch_choices.extend([len(datasets)] * int(np.ceil(len(bucket_indices) / batch_size)))
+            bucket_cache_path = f"{cache_path}_{boundary}" if cache_path else cache_path
+            datasets.append(self._build_dataset(bucket_features, bucket_targets, batch_size, ft_mode, cache_path=bucket_cache_path, prefetch=None, **pipeline_options))
+        choice_dataset = tf.data.Dataset.from_tensor_slices(np.array(batch_choices, dtype=np.int64))
+        # Training mixes the buckets in a new order every epoch, the other splits go through them from short to long
+        if DatasetModes(data_mode) == DatasetModes.TRAIN:
+            choice_dataset = choice_dataset.shuffle(len(batch_choices), reshuffle_each_iteration=True)
+        dataset = tf.data.Dataset.choose_from_datasets(datasets, choice_dataset)
+        return dataset.prefetch(prefetch) if prefetch else dataset
+
+    def _get_lazy_prefix_dataset(self, batch_size=1, data_mode: DatasetModes = DatasetModes.TRAIN, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY, **pipeline_options):
+        prefix_index, targets = self._get_split(data_mode)
+        container = self.data_container_tensor
+        max_len = self.max_len
+
+        def gather_prefixes(index, target):
+            # Position t of a prefix cut at c holds event t - (max_len - c) of the trace and padding if that is negative
+            source_positions = tf.range(max_len, dtype=index.dtype)[None] - (max_len - index[:, 1:2])
+            trace_indices = tf.broadcast_to(index[:, :1], tf.shape(source_positions))
+            gather_index = tf.stack([trace_indices, tf.maximum(source_positions, 0)], axis=-1)
+            prefixes = {}
+            for field in self._get_required_fields(ft_mode):
+                values = container[field]
+                mask = tf.cast(source_positions >= 0, values.dtype)
+                prefixes[field] = tf.gather_nd(values, gather_index) * (mask if field == "event" else mask[..., None])
+            return self._prepare_input_tensors(prefixes, ft_mode), target
+
+        dataset = tf.data.Dataset.from_tensor_slices((prefix_index, targets))
+        return self.build_pipeline(dataset, gather_prefixes, batch_size, **pipeline_options)
+
+    @property
+    def data_container_tensor(self) -> Dict[str, tf.Tensor]:
+        # Shared by all splits, so the base container is only copied into tensorflow once. One tensor per field of container_dtype.
+        if getattr(self, "_data_container_tensor", None) is None:
+            self._data_container_tensor = {field: tf.convert_to_tensor(np.ascontiguousarray(self.data_container[field])) for field in self.data_container.dtype.names}
+        return self._data_container_tensor
 
     def gather_full_dataset(self, dataset: tf.data.Dataset):
+        # Stacks whole batches, so prefer a large batch size or get_split_arrays for the splits of this reader
         collector = []
         for features, target in dataset:
             instance = ((features, ) if type(features) is not tuple else features) + (target, )
-            collector.append(instance)
-        all_stuff = zip(*collector)
-        stacked_all_stuff = [np.vstack(tmp) for tmp in all_stuff]
+            collector.append([np.asarray(tmp) for tmp in instance])
+        stacked_all_stuff = [np.concatenate(tmp) for tmp in zip(*collector)]
         return stacked_all_stuff[:-1], stacked_all_stuff[-1]
 
+    def get_split_arrays(self, data_mode: DatasetModes = DatasetModes.TEST, ft_mode: FeatureModes = FeatureModes.EVENT_ONLY, num_instances: int = None):
+        """Same result as gather_full_dataset(get_dataset(1, data_mode, ft_mode)), but straight from the split without iterating a dataset."""
+        features, targets = self._get_split(data_mode)
+        features, targets = features[:num_instances], targets[:num_instances]
+        if self.mode == TaskModes.NEXT_EVENT_LAZY:
+            features = self._get_prefix_windows(self.data_container)[features[:, 0], features[:, 1]]
+        res_features, _ = self._prepare_input_data(features, None, ft_mode)
+        return list(res_features) if type(res_features) is tuple else [res_features], np.asarray(targets)
+
     def prepare_input(self, features: np.ndarray, targets: np.ndarray = None):
         return tf.data.Dataset.from_tensor_slices(self._prepare_input_data(features, targets))
 
@@ -443,6 +907,12 @@ class AbstractProcessLogReader():
         example = df_traces[random_starting_point:random_starting_point + num_traces]
         return [val for val in example.values]
 
+    @property
+    def _traces(self) -> Dict[str, pd.DataFrame]:
+        if getattr(self, "_trace_dict", None) is None:
+            self._trace_dict = {idx: df for idx, df in self.data.groupby(by=self.col_case_id)}
+        return self._trace_dict
+
     @property
     def original_data(self):
         return self._original_data.copy()
@@ -473,11 +943,11 @@ class AbstractProcessLogReader():
 
     @property
     def _log_size(self):
-        return len(self._traces)
+        return self.log_len
 
     @property
     def _distinct_trace_ratio(self):
-        return len(set(tuple(tr) for tr in self._traces.values())) / self._log_size
+        return len(np.unique(self._get_events(self.data_container), axis=0)) / self._log_size
 
     @property
     def _min_seq_len(self):
@@ -497,7 +967,7 @@ class CSVLogReader(AbstractProcessLogReader):
         super().__init__(log_path, csv_path, **kwargs)
         self.sep = sep
 
-    def init_log(self, save=False):
+    def init_log(self, save=False, **kwargs):
         self._original_data = pd.read_csv(self.log_path, sep=self.sep)
         col_mappings = {
             self.col_timestamp: "time:timestamp",
@@ -518,19 +988,19 @@ class CSVLogReader(AbstractProcessLogReader):
             TO_EVENT_LOG.value.Parameters.CASE_ID_KEY: self.col_case_id,
             # TO_EVENT_LOG.value.Parameters.: self.caseId,
         }
-        self.log = self.log if self.log is not None else log_converter.apply(self.original_data, parameters=parameters, variant=TO_EVENT_LOG)
+        self.log = self._log if self._log is not None else log_converter.apply(self.original_data, parameters=parameters, variant=TO_EVENT_LOG)
         if self.debug:
             print(self.log[1][0])  #prints the first event of the first trace of the given log
         self._original_data = pm4py.convert_to_dataframe(self.log)
         if save:
-            self._original_data.to_csv(self.csv_path, index=False)
+            self._save_original_data()
         return self
 
-    def init_data(self):
+    def init_data(self, track_memory: bool = False):
         self.col_timestamp = "time:timestamp"
         self.col_activity_id = "concept:name"
         self.col_case_id = "case:concept:name"
-        return super().init_data()
+        return super().init_data(track_memory)
 
 
 def test_dataset(reader: AbstractProcessLogReader, batch_size=42, ds_mode: DatasetModes = None, ft_mode: FeatureModes = None):